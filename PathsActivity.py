@@ -27,7 +27,7 @@ from sugar3.graphics.icon import Icon
 from sugar3.datastore import datastore
 
 from toolbar_utils import button_factory, image_factory, label_factory, \
-    separator_factory
+    separator_factory, combo_factory
 
 import telepathy
 from dbus.service import signal
@@ -44,12 +44,16 @@ import locale
 import os.path
 
 from game import Game, TILES
-from hand import Hand
-from genpieces import generate_xo
-from utils import json_load, json_dump, svg_str_to_pixbuf
 from constants import ROW, COL
+from genpieces import generate_xo
+from utils import json_load, json_dump
+from codec import load
+import rastercache
+from rastercache import svg_str_to_surface, surface_to_pixbuf
 
 MAX_HANDS = 4
+KEYFRAME_MOVES = 16  # moves between full snapshots of the game
+BOARD_SIZES = [(8, 8), (12, 12), (16, 16)]  # rows, columns
 
 SERVICE = 'org.sugarlabs.PathsActivity'
 IFACE = SERVICE
@@ -63,6 +67,10 @@ class PathsActivity(activity.Activity):
         """ Initialize the toolbars and the game board """
         super(PathsActivity, self).__init__(handle)
 
+        # Keep the rasterized images between runs.
+        rastercache.CACHE.set_path(os.path.join(
+            self.get_activity_root(), 'data', 'raster'))
+
         self.nick = profile.get_nick_name()
         if profile.get_color() is not None:
             self.colors = profile.get_color().to_string().split(',')
@@ -79,11 +87,19 @@ class PathsActivity(activity.Activity):
         canvas.show()
         self.show_all()
 
-        self._game = Game(canvas, parent=self, colors=self.colors)
+        # Resume on the board the game was saved on.
+        rows, cols = ROW, COL
+        if 'rows' in self.metadata and 'cols' in self.metadata:
+            rows = int(self.metadata['rows'])
+            cols = int(self.metadata['cols'])
+        self._game = Game(canvas, parent=self, colors=self.colors,
+                          rows=rows, cols=cols)
+        if (rows, cols) in BOARD_SIZES:
+            self.board_size.set_active(BOARD_SIZES.index((rows, cols)))
         self._setup_presence_service()
 
         # Restore game state from Journal or start new game
-        if 'deck' in self.metadata:
+        if 'deck' in self.metadata or 'seed' in self.metadata:
             self._restore()
         else:
             self._game.new_game()
@@ -113,15 +129,28 @@ class PathsActivity(activity.Activity):
             'robot-off', self.toolbar, self._robot_cb,
             tooltip= _('Play with the robot.'))
 
+        self.board_size = combo_factory(
+            ['%d x %d' % (rows, cols) for rows, cols in BOARD_SIZES],
+            self.toolbar, self._board_size_cb,
+            tooltip=_('Size of the board.'))
+
         self.player = image_factory(
-            svg_str_to_pixbuf(generate_xo(scale=0.8,
-                                          colors=['#303030', '#303030'])),
+            surface_to_pixbuf(svg_str_to_surface(generate_xo(
+                scale=0.8, colors=['#303030', '#303030']))),
             self.toolbar, tooltip=self.nick)
 
         self.dialog_button = button_factory(
             'go-next', self.toolbar, self._dialog_cb,
             tooltip=_('Turn complete'))
 
+        self.undo_button = button_factory(
+            'edit-undo', self.toolbar, self._undo_cb,
+            tooltip=_('Take back your turn.'), accelerator='<Ctrl>z')
+
+        self.redo_button = button_factory(
+            'edit-redo', self.toolbar, self._redo_cb,
+            tooltip=_('Take your turn again.'), accelerator='<Ctrl>y')
+
         self.status = label_factory(self.toolbar, '')
 
         self.hint_button = button_factory(
@@ -150,6 +179,16 @@ class PathsActivity(activity.Activity):
             self.set_robot_status(False, 'robot-off')
             self._game.new_game()
 
+    def _board_size_cb(self, combo):
+        ''' Start a new game on a board of another size. '''
+        if not hasattr(self, '_game') or combo.get_active() < 0:
+            return
+        rows, cols = BOARD_SIZES[combo.get_active()]
+        if rows == self._game.rows and cols == self._game.cols:
+            return
+        self._game.set_board_size(rows, cols)
+        self._game.new_game()
+
     def set_robot_status(self, status, icon):
         ''' Reset robot icon and status '''
         self._game.playing_with_robot = status
@@ -160,6 +199,14 @@ class PathsActivity(activity.Activity):
         if self._game.placed_a_tile:
             self._game.took_my_turn()
 
+    def _undo_cb(self, button=None):
+        ''' Take back a turn (not when sharing) '''
+        self._game.undo()
+
+    def _redo_cb(self, button=None):
+        ''' Take a turn taken back again '''
+        self._game.redo()
+
     def _hint_cb(self, button=None):
         ''' Give a hint as to where to place a tile '''
         if not self._game.placed_a_tile:
@@ -174,8 +221,33 @@ class PathsActivity(activity.Activity):
                 del self.metadata['hand-' + str(i)]
         if 'robot' in self.metadata:
             del self.metadata['robot']
-        self.metadata['deck'] = self._game.deck.serialize()
-        self.metadata['grid'] = self._game.grid.serialize()
+        if 'pending' in self.metadata:
+            del self.metadata['pending']
+
+        # Save a keyframe of the deck and grid every so often...
+        pending = self._game.pending_move()
+        moves = self._game.moves
+        if moves.needs_keyframe or len(moves) >= KEYFRAME_MOVES:
+            # The deck order follows from its seed, if it has one.
+            for key in ['deck', 'seed']:
+                if key in self.metadata:
+                    del self.metadata[key]
+            seed = self._game.deck.serialize_seed()
+            if seed is None:
+                self.metadata['deck'] = self._game.deck.serialize()
+            else:
+                self.metadata['seed'] = seed
+            self.metadata['grid'] = self._game.grid.serialize(pending)
+            self.metadata['moves'] = ''
+            moves.keyframe()
+        # ...and otherwise just the moves played since the last save.
+        else:
+            self.metadata['moves'] += moves.unsaved()
+        if pending is not None:
+            tile = self._game.grid.grid[pending]
+            self.metadata['pending'] = json_dump([tile.number,
+                                                  tile.orientation, pending])
+
         if self._game.we_are_sharing():
             for i, hand in enumerate(self._game.hands):
                 self.metadata['hand-' + str(i)] = hand.serialize()
@@ -185,39 +257,50 @@ class PathsActivity(activity.Activity):
                 self.metadata['hand-1'] = self._game.hands[1].serialize()
                 self.metadata['robot'] = 'True'
 
+        self.metadata['rows'] = str(self._game.rows)
+        self.metadata['cols'] = str(self._game.cols)
         self.metadata['score'] = str(self._game.score)
         self.metadata['index'] = str(self._game.deck.index)
-        if self._game.last_spr_moved is not None and \
-           self._game.grid.spr_to_grid(self._game.last_spr_moved) is not None:
-            self.metadata['last'] = str(self._game.grid.grid[
-                self._game.grid.spr_to_grid(self._game.last_spr_moved)].number)
+        if self._game.last_spr_moved is not None:
+            i = self._game.grid.spr_to_grid(self._game.last_spr_moved)
+            if i is not None:
+                self.metadata['last'] = str(self._game.grid.grid[i].number)
 
     def _restore(self):
         """ Restore the game state from metadata """
         if 'robot' in self.metadata:
             self.set_robot_status(True, 'robot-on')
-        if 'deck' in self.metadata:
+        if 'seed' in self.metadata:
+            self._game.deck.restore_seed(self.metadata['seed'])
+        elif 'deck' in self.metadata:
             self._game.deck.restore(self.metadata['deck'])
         if 'grid' in self.metadata:
             self._game.grid.restore(self.metadata['grid'], self._game.deck)
+        if 'moves' in self.metadata:
+            # Replay the moves played since the keyframe.
+            self._game.moves.restore(self.metadata['moves'])
+            for number, orientation, i, points in self._game.moves.moves:
+                self._game.grid.add_tile_to_grid(number, orientation, i,
+                                                 self._game.deck)
+        if 'pending' in self.metadata:
+            self._game.place_pending(*json_load(self.metadata['pending']))
         self._game.show_connected_tiles()
 
         for i in range(MAX_HANDS):
             if 'hand-' + str(i) in self.metadata:
                 # hand-0 is already appended
                 if i > 0:  # Add robot or shared hand?
-                    self._game.hands.append(
-                        Hand(self._game.tile_width, self._game.tile_height,
-                             remote=True))
+                    self._game.add_hand()
                 self._game.hands[i].restore(self.metadata['hand-' + str(i)],
                                             self._game.deck)
 
         if 'index' in self.metadata:
             self._game.deck.index = int(self.metadata['index'])
         else:
-            self._game.deck.index = ROW * COL - self._game.grid.tiles_in_grid()
+            self._game.deck.index = self._game.deck.count() - \
+                self._game.grid.tiles_in_grid()
             for hand in self._game.hands:
-                self._game.deck.index += (COL - hand.tiles_in_hand())
+                self._game.deck.index += (hand.size - hand.tiles_in_hand())
 
         if 'score' in self.metadata:
             self._game.score = int(self.metadata['score'])
@@ -225,11 +308,9 @@ class PathsActivity(activity.Activity):
 
         self._game.last_spr_moved = None
         if 'last' in self.metadata:
-            j = int(self.metadata['last'])
-            for k in range(ROW * COL):
-                if self._game.deck.tiles[k].number == j:
-                    self._game.last_spr_moved = self._game.deck.tiles[k].spr
-                    break
+            tile = self._game.deck.number_to_tile(int(self.metadata['last']))
+            if tile is not None:
+                self._game.last_spr_moved = tile.spr
 
     # Collaboration-related methods
 
@@ -242,8 +323,8 @@ class PathsActivity(activity.Activity):
         self.owner = owner
         self._game.buddies.append(self.nick)
         self._player_colors = [self.colors]
-        self._player_pixbuf = [svg_str_to_pixbuf(
-                generate_xo(scale=0.8, colors=self.colors))]
+        self._player_pixbuf = [surface_to_pixbuf(svg_str_to_surface(
+                generate_xo(scale=0.8, colors=self.colors)))]
         self._share = ""
         self.connect('shared', self._shared_cb)
         self.connect('joined', self._joined_cb)
@@ -289,9 +370,12 @@ class PathsActivity(activity.Activity):
             self._new_game_button.set_icon('no-new-game')
             self._new_game_button.set_tooltip(
                 _('Only the sharer can start a new game.'))
+            self.board_size.set_sensitive(False)
 
         self.robot_button.set_icon('no-robot')
         self.robot_button.set_tooltip(_('The robot is disabled when sharing.'))
+        self.undo_button.set_sensitive(False)
+        self.redo_button.set_sensitive(False)
 
         # display your XO on the toolbar
         self.player.set_from_pixbuf(self._player_pixbuf[0])
@@ -359,8 +443,8 @@ state=%d' % (id, initiator, type, service, params, state))
         if not nick in self._game.buddies:
             self._game.buddies.append(nick)
             self._player_colors.append(colors)
-            self._player_pixbuf.append(svg_str_to_pixbuf(
-                generate_xo(scale=0.8, colors=colors)))
+            self._player_pixbuf.append(surface_to_pixbuf(svg_str_to_surface(
+                generate_xo(scale=0.8, colors=colors))))
 
     def _buddy_list(self, payload):
         ''' Sharer sent the updated buddy list. '''
@@ -369,8 +453,14 @@ state=%d' % (id, initiator, type, service, params, state))
             self._append_player(nick, colors[i])
 
     def _new_game(self, payload):
-        ''' Sharer can start a new game. '''
+        ''' Sharer can start a new game (on a board of rows x cols). '''
         if not self.initiating:
+            size = json_load(payload)
+            if len(size) == 2:
+                self._game.set_board_size(size[0], size[1])
+                if tuple(size) in BOARD_SIZES:
+                    self.board_size.set_active(
+                        BOARD_SIZES.index(tuple(size)))
             self._game.new_game()
 
     def _game_over(self, payload):
@@ -379,15 +469,21 @@ state=%d' % (id, initiator, type, service, params, state))
             self._game.game_over()
 
     def _sending_deck(self, payload):
-        ''' Sharer sends the deck. '''
-        self._game.deck.restore(payload)
+        ''' Sharer sends the seed of the deck (or the deck itself). '''
+        deck = load(payload)
+        if len(deck) == 2 and isinstance(deck[0], basestring):
+            self._game.deck.restore_seed(payload)
+        else:
+            self._game.deck.restore(payload)
+        # A new deck needs a new keyframe.
+        self._game.moves.needs_keyframe = True
         for tile in self._game.deck.tiles:
             tile.reset()
             tile.hide()
 
     def _sending_hand(self, payload):
         ''' Sharer sends a hand. '''
-        hand = json_load(payload)
+        hand = load(payload)
         nick = hand[0]
         if nick == self.nick:
             self._game.hands[self._game.buddies.index(nick)].restore(
@@ -396,23 +492,17 @@ state=%d' % (id, initiator, type, service, params, state))
     def _play_a_piece(self, payload):
         ''' When a piece is played, everyone should move it into position. '''
         tile_number, orientation, grid_position = json_load(payload)
-        for i in range(ROW * COL):  # find the tile with this number
-            if self._game.deck.tiles[i].number == tile_number:
-                tile_to_move = i
-                break
-        self._game.grid.add_tile_to_grid(tile_to_move, orientation,
+        self._game.grid.add_tile_to_grid(tile_number, orientation,
                                          grid_position, self._game.deck)
+        self._game.log_move(grid_position)
         self._game.show_connected_tiles()
 
         if self.initiating:
             # First, remove the piece from whatever hand it was played.
-            for i in range(COL):
-                if self._game.hands[self._game.whos_turn].hand[i] is not None \
-                   and \
-                   self._game.hands[self._game.whos_turn].hand[i].number == \
-                        tile_number:
-                    self._game.hands[self._game.whos_turn].hand[i] = None
-                    break
+            hand = self._game.hands[self._game.whos_turn]
+            i = hand.tile_to_hand(self._game.deck.number_to_tile(tile_number))
+            if i is not None:
+                hand.set_tile(i, None)
 
             # Then let the next player know it is their turn.
             self._game.whos_turn += 1
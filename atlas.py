@@ -0,0 +1,94 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+
+from genpieces import generate_tile_1_line, generate_tile_2_lines, draw
+from rastercache import svg_str_to_surface
+
+# The SVG for each of the engine TILE_TYPES: [generator, path arguments,
+# and the colors for each of its highlight variants].
+TILE_IMAGES = [
+    [generate_tile_1_line, [-1, 0, 0, 0], [None]],
+    [generate_tile_1_line, [-1, 0, 1, 0], [None]],
+    [generate_tile_2_lines, [-1, 0, 1, 0, 0, 0, 0, 1], [[None, None]]],
+    [generate_tile_2_lines, [-1, 0, 0, 0, 0, -1, 0, 0], [[None, None]]],
+    [generate_tile_2_lines, [-1, 0, 1, 0, 0, -1, 0, 1], [[None, None]]],
+    [generate_tile_2_lines, [0, -1, 1, 0, -1, 0, 0, 1],
+     [[None, '#000000'], ['#000000', None], [None, None]]],
+    [generate_tile_2_lines, [0, -1, 1, 0, -1, 0, 0, 0],
+     [[None, '#000000'], ['#000000', None], [None, None]]],
+]
+
+def rotate_args(args, turns):
+    ''' Turn the path end points (x1, y1, x2, y2, ...), which run from -1
+    to 1 about the middle of the tile, clockwise turns times. '''
+    args = args[:]
+    for turn in range(turns):
+        for i in range(0, len(args), 2):
+            args[i], args[i + 1] = -args[i + 1], args[i]
+    return args
+
+
+def _highlight_colors(colors, color):
+    ''' Substitute the highlight color for None. '''
+    if colors is None:
+        return color
+    return [color if c is None else c for c in colors]
+
+
+class Atlas(object):
+    ''' The tile images for one scale and highlight color. Each image is
+    made once, the first time it is asked for, and shared by all the
+    tiles that show it. The images belong to the atlas, so they go when
+    it does (e.g., when the board changes size).
+
+    Variant 0 is the plain tile; the others are its highlight variants
+    (for when one or more of its paths are closed). Each orientation is
+    drawn in that orientation, so only the images that are shown are
+    ever made.
+
+    By default the tiles are drawn straight onto cairo surfaces (vector);
+    otherwise their SVG is rasterized (and cached on disk). The SVG is
+    always available from svg(), e.g. for export. '''
+
+    def __init__(self, scale=1.0, color='#000000', vector=True):
+        self.scale = scale
+        self.color = color
+        self.vector = vector
+        # self._images[(type, variant, turns)] = surface
+        self._images = {}
+
+    def variants(self, tile_type):
+        ''' How many images (plain and highlighted) does the type have? '''
+        return 1 + len(TILE_IMAGES[tile_type][2])
+
+    def _generator_args(self, tile_type, variant, turns):
+        generator, args, variants = TILE_IMAGES[tile_type]
+        args = rotate_args(args, turns) + [self.scale]
+        if variant > 0:
+            args.append(_highlight_colors(variants[variant - 1], self.color))
+        return generator, args
+
+    def svg(self, tile_type, variant, turns=0):
+        ''' The SVG of an image, turned clockwise turns times '''
+        generator, args = self._generator_args(tile_type, variant, turns)
+        return generator(*args)
+
+    def get_image(self, tile_type, variant, turns):
+        ''' Return an image, turned clockwise turns times. '''
+        key = (tile_type, variant, turns)
+        if key not in self._images:
+            if self.vector:
+                generator, args = self._generator_args(tile_type, variant,
+                                                       turns)
+                self._images[key] = draw(generator, *args)
+            else:
+                self._images[key] = svg_str_to_surface(
+                    self.svg(tile_type, variant, turns))
+        return self._images[key]
@@ -0,0 +1,180 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+'''
+
+codec.py packs the grid, the deck and the hands into a few bytes for
+saving to the Journal and for sharing:
+
+  grid: a bitset of the occupied cells, then one byte per occupied cell
+        holding the tile number (top six bits) and the orientation
+        (bottom two bits)
+  deck: the tile numbers in deck order, one byte each
+  hand: the buddy's nick (if any), a bitset of the occupied slots, then
+        one byte per tile number
+
+The numbers take two bytes each when one is not enough (e.g., for the
+larger decks of deck_counts).
+
+The bytes are base64 encoded behind a version prefix (e.g., 'P1:'), so
+that they can go into the metadata and over the tube. Anything without
+the prefix is taken to be the JSON of older versions.
+
+Example usage:
+        text = dump_grid(grid)  # grid is [[number, orientation], ...]
+        grid = load(text)
+
+'''
+
+import json
+import struct
+from base64 import b64encode, b64decode
+
+# Change the version whenever the format changes.
+VERSION = 1
+PREFIX = 'P'
+
+GRID = 'g'
+DECK = 'd'
+HAND = 'h'
+
+# kind, bytes per number, number of cells (or tiles or slots)
+HEADER = struct.Struct('>cBH')
+WIDTHS = {1: 'B', 2: 'H'}
+
+
+def _width(largest):
+    ''' The bytes needed to hold numbers up to largest. '''
+    if largest < 256:
+        return 1
+    return 2
+
+
+def _pack_numbers(data, numbers, width):
+    data.extend(struct.pack('>%d%s' % (len(numbers), WIDTHS[width]),
+                            *numbers))
+
+
+def _unpack_numbers(data, offset, count, width):
+    numbers = struct.unpack_from('>%d%s' % (count, WIDTHS[width]), data,
+                                 offset)
+    return list(numbers), offset + count * width
+
+
+def _pack_bitset(data, flags):
+    bits = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            bits[i >> 3] |= 1 << (i & 7)
+    data.extend(bits)
+
+
+def _unpack_bitset(data, offset, count):
+    flags = [bool(data[offset + (i >> 3)] & (1 << (i & 7)))
+             for i in range(count)]
+    return flags, offset + (count + 7) // 8
+
+
+def _to_text(data):
+    return '%s%d:%s' % (PREFIX, VERSION, b64encode(bytes(data)))
+
+
+def dump_grid(grid):
+    ''' Pack a list of [tile number, orientation] (or [None, None]). '''
+    values = [(number << 2) | ((orientation // 90) & 3)
+              for number, orientation in grid if number is not None]
+    width = _width(max(values + [0]))
+    data = bytearray(HEADER.pack(GRID, width, len(grid)))
+    _pack_bitset(data, [cell[0] is not None for cell in grid])
+    _pack_numbers(data, values, width)
+    return _to_text(data)
+
+
+def dump_deck(order):
+    ''' Pack the tile numbers in deck order. '''
+    width = _width(max(order + [0]))
+    data = bytearray(HEADER.pack(DECK, width, len(order)))
+    _pack_numbers(data, order, width)
+    return _to_text(data)
+
+
+def dump_hand(hand, buddy=None):
+    ''' Pack the tile numbers (or None) in a hand, and the buddy's nick. '''
+    numbers = [number for number in hand if number is not None]
+    width = _width(max(numbers + [0]))
+    data = bytearray(HEADER.pack(HAND, width, len(hand)))
+    if buddy is None:
+        data.append(0)
+    else:
+        if isinstance(buddy, unicode):
+            buddy = buddy.encode('utf-8')
+        data.append(1)
+        data.extend(struct.pack('>H', len(buddy)))
+        data.extend(buddy)
+    _pack_bitset(data, [number is not None for number in hand])
+    _pack_numbers(data, numbers, width)
+    return _to_text(data)
+
+
+def _json_load(text):
+    ''' Load the JSON of older versions (or, as utils.json_load does, a
+    list of whitespace-separated numbers). json is used directly, rather
+    than through utils, so that the codec does not need gi. '''
+    try:
+        return json.loads(text)
+    except ValueError:
+        return [int(value) for value in text.split()]
+
+
+def load(text):
+    ''' Unpack a grid, deck or hand, in the lists the JSON held: a hand
+    packed with a buddy has the nick as its first item. '''
+    if not text.startswith(PREFIX):
+        return _json_load(text)
+    version, colon, packed = text[len(PREFIX):].partition(':')
+    if not colon or not version.isdigit() or int(version) > VERSION:
+        raise ValueError('cannot load version %s' % (version))
+    data = bytearray(b64decode(packed))
+    kind, width, count = HEADER.unpack_from(bytes(data))
+    offset = HEADER.size
+    if kind == GRID:
+        flags, offset = _unpack_bitset(data, offset, count)
+        values, offset = _unpack_numbers(data, offset, flags.count(True),
+                                         width)
+        values.reverse()
+        grid = []
+        for flag in flags:
+            if flag:
+                value = values.pop()
+                grid.append([value >> 2, (value & 3) * 90])
+            else:
+                grid.append([None, None])
+        return grid
+    elif kind == DECK:
+        order, offset = _unpack_numbers(data, offset, count, width)
+        return order
+    elif kind == HAND:
+        hand = []
+        offset += 1
+        if data[offset - 1]:
+            length = struct.unpack_from('>H', bytes(data), offset)[0]
+            offset += 2
+            hand.append(bytes(data[offset:offset + length]).decode('utf-8'))
+            offset += length
+        flags, offset = _unpack_bitset(data, offset, count)
+        numbers, offset = _unpack_numbers(data, offset, flags.count(True),
+                                          width)
+        numbers.reverse()
+        for flag in flags:
+            if flag:
+                hand.append(numbers.pop())
+            else:
+                hand.append(None)
+        return hand
+    raise ValueError('unknown kind %r' % (kind))
@@ -16,6 +16,7 @@ WEST = SOUTH + 1
 
 ROW = 8
 COL = 8
+HAND_SIZE = 8
 
 HIDE = 0
 BOARD = 1
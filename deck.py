@@ -9,130 +9,83 @@
 # along with this library; if not, write to the Free Software
 # Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
 
-from random import randrange
-
+import engine
+from atlas import Atlas
 from tile import Tile, board_card
-from genpieces import generate_tile_1_line, generate_tile_2_lines
+from codec import dump_deck, load
 from utils import json_dump, json_load
 from constants import HIDE, BOARD, ROW, COL
 
 
-class Deck:
+class Deck(object):
     ''' Class for defining deck of tiles. '''
 
-    def __init__(self, sprites, scale=1.0, color='#000000'):
-        ''' Create the deck of tiles. '''
+    def __init__(self, sprites, scale=1.0, color='#000000', model=None,
+                 rows=ROW, cols=COL):
+        ''' Create the deck of tiles (one for each square of the board). '''
+        if model is None:
+            model = engine.Deck(rows * cols)
+        self.model = model
+        # The tiles of a type share their images.
+        self.atlas = Atlas(scale, color)
+        self._tiles_by_number = []
+        self._tiles_by_spr = {}
+        for piece in self.model.by_number:
+            tile = Tile(sprites, piece, self.atlas)
+            self._tiles_by_number.append(tile)
+            self._tiles_by_spr[tile.spr] = tile
         self.tiles = []
-        i = 0
-        for a in range(16):
-            self.tiles.append(Tile(sprites,
-                generate_tile_1_line(-1, 0, 0, 0, scale),
-                [generate_tile_1_line(-1, 0, 0, 0, scale, color)], number=i))
-            self.tiles[-1].set_paths([[0, 0, 0, 1]])
-            i += 1
-        for a in range(4):
-            self.tiles.append(Tile(sprites,
-                generate_tile_1_line(-1, 0, 1, 0, scale),
-                [generate_tile_1_line(-1, 0, 1, 0, scale, color)], number=i))
-            self.tiles[-1].set_paths([[0, 1, 0, 1]])
-            i += 1
-        for a in range(12):
-            self.tiles.append(Tile(sprites,
-                generate_tile_2_lines(-1, 0, 1, 0, 0, 0, 0, 1, scale),
-                [generate_tile_2_lines(-1, 0, 1, 0, 0, 0, 0, 1, scale,
-                                        [color, color])], number=i))
-            self.tiles[-1].set_paths([[0, 1, 1, 1]])
-            self.tiles[-1].set_value(2)
-            i += 1
-        for a in range(16):
-            self.tiles.append(Tile(sprites,
-                generate_tile_2_lines(-1, 0, 0, 0, 0, -1, 0, 0, scale),
-                [generate_tile_2_lines(-1, 0, 0, 0, 0, -1, 0, 0, scale,
-                                        [color, color])], number=i))
-            self.tiles[-1].set_paths([[1, 0, 0, 1]])
-            i += 1
-        for a in range(4):
-            self.tiles.append(Tile(sprites,
-                generate_tile_2_lines(-1, 0, 1, 0, 0, -1, 0, 1, scale),
-                [generate_tile_2_lines(-1, 0, 1, 0, 0, -1, 0, 1, scale,
-                                        [color, color])], number=i))
-            self.tiles[-1].set_paths([[1, 1, 1, 1]])
-            self.tiles[-1].set_value(4)
-            i += 1
-        for a in range(8):
-            self.tiles.append(Tile(sprites,
-                generate_tile_2_lines(0, -1, 1, 0, -1, 0, 0, 1, scale),
-                [generate_tile_2_lines(0, -1, 1, 0, -1, 0, 0, 1, scale,
-                                       [color, '#000000']),
-                 generate_tile_2_lines(0, -1, 1, 0, -1, 0, 0, 1, scale,
-                                       ['#000000', color]),
-                 generate_tile_2_lines(0, -1, 1, 0, -1, 0, 0, 1, scale,
-                                       [color, color])], number=i))
-            self.tiles[-1].set_paths([[1, 1, 0, 0], [0, 0, 1, 1]])
-            self.tiles[-1].set_value(4)
-            i += 1
-        for a in range(4):
-            self.tiles.append(Tile(sprites,
-                generate_tile_2_lines(0, -1, 1, 0, -1, 0, 0, 0, scale),
-                [generate_tile_2_lines(0, -1, 1, 0, -1, 0, 0, 0, scale,
-                                       [color, '#000000']),
-                 generate_tile_2_lines(0, -1, 1, 0, -1, 0, 0, 0, scale,
-                                       ['#000000', color]),
-                 generate_tile_2_lines(0, -1, 1, 0, -1, 0, 0, 0, scale,
-                                       [color, color])], number=i))
-            self.tiles[-1].set_paths([[1, 1, 0, 0], [0, 0, 0, 1]])
-            self.tiles[-1].set_value(3)
-            i += 1
-
-        # Remember the current position in the deck.
-        self.index = 0
+        self._sync()
 
         # And a playing surface
-        self.board = board_card(sprites, scale=scale)
+        self.board = board_card(sprites, scale=scale, rows=rows, cols=cols)
         self.board.set_layer(BOARD)
 
-    def shuffle(self):
-        ''' Shuffle the deck (Knuth algorithm). '''
-        decksize = self.count()
+    def _sync(self):
+        ''' Put the tiles in the same order as the model. '''
+        self.tiles = [self._tiles_by_number[piece.number]
+                      for piece in self.model.pieces]
+
+    @property
+    def index(self):
+        ''' The current position in the deck. '''
+        return self.model.index
+
+    @index.setter
+    def index(self, index):
+        self.model.index = index
+
+    def shuffle(self, seed=None, rng=engine.rng.DEFAULT_RNG):
+        ''' Shuffle the deck (Knuth algorithm); the same seed always
+        gives the same order. Return the seed. '''
         # Hide all the tiles and make sure they are back to orientation 0
         for tile in self.tiles:
             tile.reset()
-        # Randomize the tile order.
-        for n in range(decksize):
-            i = randrange(decksize - n)
-            self.swap_tiles(n, decksize - 1 - i)
-        # Reset the index to the beginning of the deck after a shuffle,
-        self.index = 0
+        seed = self.model.shuffle(seed, rng)
+        self._sync()
         self.hide()
-        return
+        return seed
+
+    def serialize_seed(self):
+        ''' Serialize the seed of the last shuffle (None if the deck was
+        restored from its order instead) '''
+        if self.model.seed is None:
+            return None
+        return json_dump([self.model.rng, self.model.seed])
 
-    def random_order(self, size=ROW * COL):
-        ''' randomize a list'''
-        order = []
-        for i in range(size):
-            order.append(i)
-        for n in range(size):
-            i = randrange(size - n)
-            a = order[n]
-            order[n] = order[size - 1 - i]
-            order[size - 1 - i] = a
-        return order
+    def restore_seed(self, seed_as_text):
+        ''' Shuffle the deck with a serialized seed. '''
+        rng, seed = json_load(seed_as_text)
+        self.shuffle(seed, rng)
 
     def serialize(self):
         ''' Serialize the deck for passing to share and saving '''
-        order = []
-        for i in range(ROW * COL):
-            order.append(self.tiles[i].number)
-        return json_dump(order)
+        return dump_deck(self.model.order())
 
     def restore(self, deck_as_text):
         ''' Restore the deck upon resume. '''
-        deck = []
-        order = json_load(deck_as_text)
-        for i in order:
-            # deck.append(self.tiles[order[i]])
-            deck.append(self.tiles[i])
-        self.tiles = deck[:]
+        self.model.restore(load(deck_as_text))
+        self._sync()
 
     def clear(self):
         ''' Remove any highlight from the tiles. '''
@@ -141,6 +94,7 @@ class Deck:
 
     def swap_tiles(self, i, j):
         ''' Swap the position of two tiles in the deck. '''
+        self.model.swap_tiles(i, j)
         tmp = self.tiles[j]
         self.tiles[j] = self.tiles[i]
         self.tiles[i] = tmp
@@ -148,36 +102,36 @@ class Deck:
 
     def spr_to_tile(self, spr):
         ''' Given a sprite, find the corresponding tile in the deck. '''
-        for tile in self.tiles:
-            if tile.spr == spr:
-                return tile
-        return None
+        return self._tiles_by_spr.get(spr)
+
+    def number_to_tile(self, number):
+        ''' Given a tile number, find the corresponding tile. '''
+        if number is None or number < 0 or \
+           number >= len(self._tiles_by_number):
+            return None
+        return self._tiles_by_number[number]
 
     def index_to_tile(self, i):
-        ''' Given a tile index, find the corresponding tile in the deck. '''
-        for tile in self.tiles:
-            if tile.index == i:
-                return tile
-        return None
+        ''' Given a tile index (its number), find the corresponding tile. '''
+        return self.number_to_tile(i)
+
+    def piece_to_tile(self, piece):
+        ''' Given an engine piece, find the corresponding tile. '''
+        if piece is None:
+            return None
+        return self._tiles_by_number[piece.number]
 
     def deal_next_tile(self):
         ''' Return the next tile from the deck. '''
-        if self.empty():
-            return None
-        next_tile = self.tiles[self.index]
-        self.index += 1
-        return next_tile
+        return self.piece_to_tile(self.model.deal_next_tile())
 
     def empty(self):
         ''' Is the deck empty? '''
-        if self.tiles_remaining() > 0:
-            return False
-        else:
-            return True
+        return self.model.empty()
 
     def tiles_remaining(self):
         ''' Return how many tiles are remaining in the deck. '''
-        return(self.count() - self.index)
+        return self.model.tiles_remaining()
 
     def hide(self):
         ''' Hide the deck. '''
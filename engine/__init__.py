@@ -0,0 +1,28 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+'''
+
+engine is the headless model of a game of Paths: the tiles, the deck,
+the hands, the board, placement legality, path scoring and the log of
+the moves played.
+
+Nothing in this package imports gi, sprites or utils, so it can be used
+without a display (e.g., for simulations). The GTK classes (Tile, Deck,
+Hand, Grid and Game) are views over these models.
+
+'''
+
+from .piece import Piece, TILE_TYPES
+from .deck import Deck
+from .hand import Hand
+from .board import Board
+from .state import GameState
+from .robot import Robot
+from .movelog import MoveLog
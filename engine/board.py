@@ -0,0 +1,207 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+
+from constants import ROW, COL, NORTH, EAST, SOUTH
+from .piece import EDGE, EDGES, OPPOSITE
+from .paths import PathTracker
+
+
+class Board:
+    ''' The model of the ROWxCOL playing surface. '''
+
+    def __init__(self, rows=ROW, cols=COL):
+        self.rows = rows
+        self.cols = cols
+        self.cells = [None] * (rows * cols)
+        self.neighbors = [[self.neighbor(cell, direction)
+                            for direction in range(4)]
+                           for cell in range(rows * cols)]
+        # Tiles join the path tracker when their paths are next tested;
+        # until then (e.g., while a tile is still being dragged around)
+        # they are pending.
+        self.paths = PathTracker(self)
+        self._pending = set()
+        # The frontier: empty cells next to an occupied cell. The cells
+        # whose playability changed since the last call to
+        # frontier_changes() are kept in _changed.
+        self.frontier = set()
+        self._occupied_neighbors = [0] * (rows * cols)
+        self._count = 0
+        self._changed = set(range(rows * cols))
+
+    def copy(self, deck):
+        ''' Return a copy of the board holding the pieces of deck. '''
+        board = Board(self.rows, self.cols)
+        for cell, piece in enumerate(self.cells):
+            if piece is not None:
+                board.place(cell, deck.by_number[piece.number])
+        board.complete_paths(None)  # Join every tile to the path tracker.
+        board.frontier_changes()
+        return board
+
+    def clear(self):
+        for i in range(len(self.cells)):
+            self.cells[i] = None
+            self._occupied_neighbors[i] = 0
+        self.paths.clear()
+        self._pending.clear()
+        if self._count > 0:
+            self._changed.update(range(len(self.cells)))
+        self._count = 0
+        self.frontier.clear()
+
+    def place(self, cell, piece):
+        ''' Put a piece on the board. '''
+        if self.cells[cell] is not None:
+            self.remove(cell)
+        self.cells[cell] = piece
+        self._pending.add(cell)
+        self._count += 1
+        if self._count == 1:  # Every other cell is no longer playable.
+            self._changed.update(range(len(self.cells)))
+        self.frontier.discard(cell)
+        self._changed.add(cell)
+        for neighbor in self.neighbors[cell]:
+            if neighbor is not None:
+                self._occupied_neighbors[neighbor] += 1
+                if self._occupied_neighbors[neighbor] == 1 and \
+                   self.cells[neighbor] is None:
+                    self.frontier.add(neighbor)
+                    self._changed.add(neighbor)
+
+    def remove(self, cell):
+        ''' Take a piece off of the board. '''
+        piece = self.cells[cell]
+        if piece is None:
+            return None
+        self.cells[cell] = None
+        if cell in self._pending:
+            self._pending.discard(cell)
+        elif self.paths.added[cell] and not self.paths.remove(cell):
+            # Only the last tile added can be taken out, so start over.
+            self.paths.clear()
+            self._pending = set([i for i, c in enumerate(self.cells)
+                                 if c is not None])
+        self._count -= 1
+        if self._count == 0:  # Every cell is playable again.
+            self._changed.update(range(len(self.cells)))
+        if self._occupied_neighbors[cell] > 0:
+            self.frontier.add(cell)
+        self._changed.add(cell)
+        for neighbor in self.neighbors[cell]:
+            if neighbor is not None:
+                self._occupied_neighbors[neighbor] -= 1
+                if self._occupied_neighbors[neighbor] == 0 and \
+                   self.cells[neighbor] is None:
+                    self.frontier.discard(neighbor)
+                    self._changed.add(neighbor)
+        return piece
+
+    def count(self):
+        ''' How many tiles are on the board? '''
+        return self._count
+
+    def neighbor(self, cell, direction):
+        ''' The cell next to cell in direction (None if off the board). '''
+        if direction == NORTH:
+            if cell >= self.cols:
+                return cell - self.cols
+        elif direction == EAST:
+            if cell % self.cols < self.cols - 1:
+                return cell + 1
+        elif direction == SOUTH:
+            if cell < (self.rows - 1) * self.cols:
+                return cell + self.cols
+        elif cell % self.cols > 0:
+            return cell - 1
+        return None
+
+    def connected(self, cell):
+        ''' Does cell abut the tiles already on the board? '''
+        if self._count == 0:
+            return True
+        return cell in self.frontier
+
+    def playable(self):
+        ''' The cells where a tile may be played. '''
+        if self._count == 0:
+            return list(range(len(self.cells)))
+        return sorted(self.frontier)
+
+    def frontier_changes(self):
+        ''' Return (and forget) the cells whose playability has changed.
+        '''
+        changed = self._changed
+        self._changed = set()
+        return changed
+
+    def bad_edges(self, cell, piece=None):
+        ''' Return the edges where piece (by default, the piece already in
+        cell) would lead a path to nowhere. '''
+        if piece is None:
+            piece = self.cells[cell]
+        bad = []
+        edges = piece.edges
+        for direction in range(4):
+            neighbor = self.neighbors[cell][direction]
+            if neighbor is None:
+                if edges & EDGE[direction]:
+                    bad.append(direction)
+            elif self.cells[neighbor] is not None:
+                theirs = self.cells[neighbor].edges & EDGE[OPPOSITE[direction]]
+                if bool(edges & EDGE[direction]) != bool(theirs):
+                    bad.append(direction)
+        return bad
+
+    def constraints(self, cell):
+        ''' Return (care, want): a tile fits in cell if the edge mask of
+        its paths, masked by care, equals want. Off the board no edge may
+        have a path; next to a tile the edges must match. '''
+        care = 0
+        want = 0
+        for direction in range(4):
+            neighbor = self.neighbors[cell][direction]
+            if neighbor is None:
+                care |= EDGE[direction]
+            elif self.cells[neighbor] is not None:
+                care |= EDGE[direction]
+                if self.cells[neighbor].edges & EDGE[OPPOSITE[direction]]:
+                    want |= EDGE[direction]
+        return care, want
+
+    def fits(self, cell, piece):
+        ''' Can piece be placed in cell in its current orientation? '''
+        care, want = self.constraints(cell)
+        return piece.edges & care == want
+
+    def legal_moves(self, pieces):
+        ''' Return every [piece, orientation, cell] that can be played,
+        without changing the board or the pieces. '''
+        moves = []
+        for cell in self.playable():
+            care, want = self.constraints(cell)
+            for piece in pieces:
+                if piece is None:
+                    continue
+                edges = EDGES[piece.type]
+                for turns in range(4):
+                    if edges[turns] & care == want:
+                        moves.append([piece, turns * 90, cell])
+        return moves
+
+    def complete_paths(self, cell):
+        ''' Return the closed paths that run through cell, each as a list
+        of [cell, path] pairs. '''
+        for i in sorted(self._pending):
+            self.paths.add(i)
+        self._pending.clear()
+        if cell is None or self.cells[cell] is None:
+            return []
+        return self.paths.closed(cell)
@@ -0,0 +1,131 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+from .piece import Piece, TILE_TYPES
+from .rng import DEFAULT_RNG, get_rng, new_seed
+
+
+def deck_counts(size):
+    ''' How many of each tile type are in a deck of size tiles: TILE_TYPES
+    in proportion, with the remainders going to the largest fractions. '''
+    total = 0
+    for definition in TILE_TYPES:
+        total += definition[0]
+    counts = []
+    fractions = []
+    for tile_type, definition in enumerate(TILE_TYPES):
+        counts.append(definition[0] * size // total)
+        fractions.append((-(definition[0] * size % total), tile_type))
+    fractions.sort()
+    for i in range(size - sum(counts)):
+        counts[fractions[i][1]] += 1
+    return counts
+
+
+class Deck:
+    ''' The model of a deck of tiles. '''
+
+    def __init__(self, size=None):
+        ''' Create the deck of tiles (by default, the 64 in TILE_TYPES;
+        otherwise, size tiles in the same proportions). '''
+        if size is None:
+            counts = [definition[0] for definition in TILE_TYPES]
+        else:
+            counts = deck_counts(size)
+        self.pieces = []
+        i = 0
+        for tile_type, count in enumerate(counts):
+            for a in range(count):
+                self.pieces.append(Piece(tile_type, number=i))
+                i += 1
+        # Tiles ordered by number (the order never changes).
+        self.by_number = self.pieces[:]
+
+        # Remember the current position in the deck.
+        self.index = 0
+
+        # The seed (and generator) of the last shuffle, if any
+        self.seed = None
+        self.rng = DEFAULT_RNG
+
+    def copy(self):
+        ''' Return an independent copy of the deck and its pieces. '''
+        deck = Deck(self.count())
+        deck.by_number = [piece.copy() for piece in self.by_number]
+        deck.restore(self.order())
+        deck.index = self.index
+        deck.seed = self.seed
+        deck.rng = self.rng
+        return deck
+
+    def shuffle(self, seed=None, rng=DEFAULT_RNG):
+        ''' Shuffle the deck (Knuth algorithm). The same seed (and
+        generator) always gives the same order; by default, a new seed is
+        chosen. Return the seed. '''
+        if seed is None:
+            seed = new_seed()
+        # Make sure the tiles are back to orientation 0
+        for piece in self.pieces:
+            piece.reset()
+        # Randomize the tile order (starting from the order by number).
+        self.restore(self.random_order(self.count(), seed, rng))
+        self.seed = seed
+        self.rng = rng
+        # Reset the index to the beginning of the deck after a shuffle,
+        self.index = 0
+        return seed
+
+    def random_order(self, size, seed=None, rng=DEFAULT_RNG):
+        ''' randomize a list (the same way for the same seed)'''
+        if seed is None:
+            seed = new_seed()
+        randrange = get_rng(seed, rng).randrange
+        order = list(range(size))
+        for n in range(size):
+            i = randrange(size - n)
+            a = order[n]
+            order[n] = order[size - 1 - i]
+            order[size - 1 - i] = a
+        return order
+
+    def order(self):
+        ''' The tile numbers in deck order. '''
+        return [piece.number for piece in self.pieces]
+
+    def restore(self, order):
+        ''' Restore the deck order from a list of tile numbers. '''
+        self.pieces = [self.by_number[i] for i in order]
+        self.seed = None
+
+    def swap_tiles(self, i, j):
+        ''' Swap the position of two tiles in the deck. '''
+        tmp = self.pieces[j]
+        self.pieces[j] = self.pieces[i]
+        self.pieces[i] = tmp
+        self.seed = None  # The order no longer follows from the seed.
+
+    def deal_next_tile(self):
+        ''' Return the next tile from the deck. '''
+        if self.empty():
+            return None
+        next_piece = self.pieces[self.index]
+        self.index += 1
+        return next_piece
+
+    def empty(self):
+        ''' Is the deck empty? '''
+        return self.tiles_remaining() <= 0
+
+    def tiles_remaining(self):
+        ''' Return how many tiles are remaining in the deck. '''
+        return self.count() - self.index
+
+    def count(self):
+        ''' Return the length of the deck. '''
+        return len(self.pieces)
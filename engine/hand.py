@@ -0,0 +1,71 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+
+from constants import HAND_SIZE
+
+
+class Hand:
+    ''' The model of the tiles in a player's hand. '''
+
+    def __init__(self, size=HAND_SIZE):
+        self.size = size
+        self.slots = [None] * size
+
+    def clear(self):
+        for i in range(self.size):
+            self.slots[i] = None
+
+    def copy(self, deck):
+        ''' Return a copy of the hand holding the pieces of deck. '''
+        hand = Hand(self.size)
+        for i, piece in enumerate(self.slots):
+            if piece is not None:
+                hand.slots[i] = deck.by_number[piece.number]
+        return hand
+
+    def deal(self, deck, number=None):
+        ''' Deal tiles into the first slots; return the slots dealt to. '''
+        if number is None:
+            number = self.size
+        dealt = []
+        for i in range(number):
+            self.slots[i] = deck.deal_next_tile()
+            if self.slots[i] is not None:
+                dealt.append(i)
+        return dealt
+
+    def set_tile(self, i, piece):
+        self.slots[i] = piece
+
+    def index(self, piece):
+        ''' Return the slot holding piece (or None). '''
+        for i in range(self.size):
+            if self.slots[i] is piece:
+                return i
+        return None
+
+    def find_empty_slot(self):
+        ''' Is there an empty slot in the hand? '''
+        for i in range(self.size):
+            if self.slots[i] is None:
+                return i
+        return None
+
+    def tiles_in_hand(self):
+        ''' How many tiles are in the hand? '''
+        return self.size - self.slots.count(None)
+
+    def value(self):
+        ''' The total value of the tiles in the hand. '''
+        total = 0
+        for piece in self.slots:
+            if piece is not None:
+                total += piece.value
+        return total
@@ -0,0 +1,84 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+import struct
+from base64 import b64encode, b64decode
+
+# Tile number (top fourteen bits) and turns (bottom two bits), cell and
+# points. Six bytes is a whole number of base64 quanta, so the text of
+# the new moves can simply be appended to the text of the old ones.
+RECORD = struct.Struct('>HHh')
+
+
+class MoveLog:
+    ''' An append-only log of the moves played since the last keyframe
+    (a full snapshot of the game). Each move is [tile number, orientation,
+    cell, points scored]. '''
+
+    def __init__(self):
+        self.moves = []
+        self.saved = 0  # moves already written out
+        self.needs_keyframe = True
+
+    def __len__(self):
+        return len(self.moves)
+
+    def clear(self):
+        ''' Start again (e.g., for a new game) from a new keyframe. '''
+        self.moves = []
+        self.saved = 0
+        self.needs_keyframe = True
+
+    def keyframe(self):
+        ''' A keyframe has been taken: the log starts again from it. '''
+        self.moves = []
+        self.saved = 0
+        self.needs_keyframe = False
+
+    def append(self, number, orientation, cell, points=0):
+        self.moves.append([number, orientation, cell, points])
+
+    def pop(self):
+        ''' Take back the last move (e.g., when it is undone). '''
+        if len(self.moves) == 0:
+            # The move is in the keyframe, so a new one is needed.
+            self.needs_keyframe = True
+            return
+        self.moves.pop()
+        if self.saved > len(self.moves):
+            # The move was written out already: write everything again.
+            self.saved = len(self.moves)
+            self.needs_keyframe = True
+
+    def unsaved(self):
+        ''' Return the text of the moves not yet written out and mark them
+        as written. '''
+        text = self._encode(self.moves[self.saved:])
+        self.saved = len(self.moves)
+        return text
+
+    def dump(self):
+        ''' The text of every move in the log. '''
+        return self._encode(self.moves)
+
+    def restore(self, text):
+        ''' Restore the log (already written out) from its text. '''
+        data = b64decode(text)
+        self.moves = []
+        for i in range(len(data) // RECORD.size):
+            tile, cell, points = RECORD.unpack_from(data, i * RECORD.size)
+            self.moves.append([tile >> 2, (tile & 3) * 90, cell, points])
+        self.saved = len(self.moves)
+        self.needs_keyframe = False
+
+    def _encode(self, moves):
+        data = ''.join([RECORD.pack((number << 2) | ((orientation // 90) & 3),
+                                    cell, points)
+                        for number, orientation, cell, points in moves])
+        return b64encode(data)
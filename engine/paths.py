@@ -0,0 +1,123 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+
+from .piece import EDGE, OPPOSITE
+
+# How many edges does each path mask reach?
+OPEN_ENDS = [bin(mask).count('1') for mask in range(16)]
+
+
+class PathTracker:
+    ''' Disjoint sets of the paths on a board, keyed by (cell, path).
+
+    Each set is a connected run of paths. It keeps its members and a
+    count of its open ends (edges that do not yet meet a neighbor), so a
+    path is closed when its count drops to zero.
+
+    The joins made for each tile are remembered, so that the tile added
+    last can be taken out again by undoing them (see remove). '''
+
+    def __init__(self, board):
+        self.board = board
+        self.clear()
+
+    def clear(self):
+        ''' Forget every path. '''
+        size = 2 * len(self.board.cells)  # at most two paths per tile
+        self.added = [False] * len(self.board.cells)
+        self._parent = list(range(size))
+        self._open = [0] * size
+        self._members = [None] * size
+        self._joins = []  # [cell, joins] for each tile, in order added
+
+    def add(self, cell):
+        ''' Add the paths of the tile in cell, joining them to those of
+        any neighbors that have already been added. '''
+        board = self.board
+        piece = board.cells[cell]
+        self.added[cell] = True
+        joins = []
+        self._joins.append([cell, joins])
+        for p, mask in enumerate(piece.masks):
+            node = 2 * cell + p
+            self._parent[node] = node
+            self._open[node] = OPEN_ENDS[mask]
+            self._members[node] = [[cell, p]]
+        for p, mask in enumerate(piece.masks):
+            for direction in range(4):
+                if not mask & EDGE[direction]:
+                    continue
+                neighbor = board.neighbors[cell][direction]
+                if neighbor is None or not self.added[neighbor]:
+                    continue
+                their_path = board.cells[neighbor].path_to(
+                    OPPOSITE[direction])
+                if their_path is not None:
+                    self._union(2 * cell + p, 2 * neighbor + their_path,
+                                joins)
+
+    def remove(self, cell):
+        ''' Take out the paths of the tile in cell, if it was the last
+        tile added; return False if it was not. '''
+        if len(self._joins) == 0 or self._joins[-1][0] != cell:
+            return False
+        cell, joins = self._joins.pop()
+        for a, b, size, open_ends in reversed(joins):
+            if b is None:
+                self._open[a] += 2
+            else:
+                self._members[b] = self._members[a][size:]
+                del self._members[a][size:]
+                self._parent[b] = b
+                self._open[a] = open_ends
+        for node in (2 * cell, 2 * cell + 1):
+            self._parent[node] = node
+            self._open[node] = 0
+            self._members[node] = None
+        self.added[cell] = False
+        return True
+
+    def _find(self, node):
+        # No path compression: it would keep remove from undoing joins.
+        # Joining the smaller set to the larger keeps the trees shallow.
+        parent = self._parent
+        while parent[node] != node:
+            node = parent[node]
+        return node
+
+    def _union(self, a, b, joins):
+        ''' Join two ends: two open ends are closed by the connection. '''
+        a = self._find(a)
+        b = self._find(b)
+        if a == b:
+            self._open[a] -= 2
+            joins.append([a, None, 0, 0])
+            return
+        if len(self._members[a]) < len(self._members[b]):
+            a, b = b, a
+        joins.append([a, b, len(self._members[a]), self._open[a]])
+        self._parent[b] = a
+        self._members[a].extend(self._members[b])
+        self._members[b] = None
+        self._open[a] += self._open[b] - 2
+
+    def closed(self, cell):
+        ''' Return the closed paths running through cell, each as a list
+        of [cell, path] pairs. '''
+        closed = []
+        roots = []
+        if not self.added[cell]:
+            return closed
+        for p in range(len(self.board.cells[cell].masks)):
+            root = self._find(2 * cell + p)
+            if root not in roots and self._open[root] == 0:
+                roots.append(root)
+                closed.append(self._members[root])
+        return closed
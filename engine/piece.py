@@ -0,0 +1,127 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+
+from constants import NORTH, EAST, SOUTH, WEST
+
+# The tiles in a deck: [count, paths, value]. Each path is [N, E, S, W],
+# where a 1 means the path reaches that edge of the tile.
+TILE_TYPES = [
+    [16, [[0, 0, 0, 1]], 1],
+    [4, [[0, 1, 0, 1]], 1],
+    [12, [[0, 1, 1, 1]], 2],
+    [16, [[1, 0, 0, 1]], 1],
+    [4, [[1, 1, 1, 1]], 4],
+    [8, [[1, 1, 0, 0], [0, 0, 1, 1]], 4],
+    [4, [[1, 1, 0, 0], [0, 0, 0, 1]], 3],
+]
+
+# Edge bits: a path is stored as a 4-bit mask of the edges it reaches.
+EDGE = [1 << NORTH, 1 << EAST, 1 << SOUTH, 1 << WEST]
+OPPOSITE = [SOUTH, WEST, NORTH, EAST]
+
+
+def path_to_mask(path):
+    ''' Convert [N, E, S, W] to an edge mask. '''
+    mask = 0
+    for direction in range(4):
+        if path[direction] == 1:
+            mask |= EDGE[direction]
+    return mask
+
+
+def mask_to_path(mask):
+    ''' Convert an edge mask to [N, E, S, W]. '''
+    return [(mask >> direction) & 1 for direction in range(4)]
+
+
+def rotate_mask(mask):
+    ''' Rotate an edge mask clockwise by 90 degrees: N->E->S->W->N. '''
+    return ((mask << 1) | (mask >> 3)) & 15
+
+
+def _rotation_tables():
+    ''' For each tile type and each of the four orientations, the path
+    masks and the union of the path masks. '''
+    masks = []
+    edges = []
+    for definition in TILE_TYPES:
+        paths = tuple([path_to_mask(path) for path in definition[1]])
+        type_masks = []
+        type_edges = []
+        for turns in range(4):
+            type_masks.append(paths)
+            union = 0
+            for mask in paths:
+                union |= mask
+            type_edges.append(union)
+            paths = tuple([rotate_mask(mask) for mask in paths])
+        masks.append(type_masks)
+        edges.append(type_edges)
+    return masks, edges
+
+ROTATIONS, EDGES = _rotation_tables()
+
+
+class Piece(object):
+    ''' The model of a tile: its paths, value and orientation. '''
+
+    __slots__ = ['type', 'number', 'value', 'turns', 'masks', 'edges']
+
+    def __init__(self, tile_type=0, number=0):
+        self.type = tile_type
+        self.number = number
+        self.value = TILE_TYPES[tile_type][2]
+        self.set_turns(0)
+
+    @property
+    def orientation(self):
+        ''' Orientation in degrees (clockwise) '''
+        return self.turns * 90
+
+    @property
+    def paths(self):
+        ''' The paths as [[N, E, S, W], ...] '''
+        return [mask_to_path(mask) for mask in self.masks]
+
+    def copy(self):
+        ''' Return an independent copy of the piece. '''
+        piece = Piece(self.type, self.number)
+        piece.value = self.value
+        piece.set_turns(self.turns)
+        return piece
+
+    def set_turns(self, turns):
+        ''' Set the number of clockwise quarter turns. '''
+        self.turns = turns & 3
+        self.masks = ROTATIONS[self.type][self.turns]
+        self.edges = EDGES[self.type][self.turns]
+
+    def set_orientation(self, orientation):
+        ''' Set the orientation in degrees. '''
+        self.set_turns(int(orientation / 90))
+
+    def reset(self):
+        ''' Return to orientation 0. '''
+        self.set_turns(0)
+
+    def rotate_clockwise(self):
+        ''' Rotate the paths by 90 degrees. '''
+        self.set_turns(self.turns + 1)
+
+    def has_edge(self, direction):
+        ''' Does any path reach this edge? '''
+        return (self.edges >> direction) & 1 == 1
+
+    def path_to(self, direction):
+        ''' Which path reaches this edge? (None if no path does.) '''
+        for i, mask in enumerate(self.masks):
+            if mask & EDGE[direction]:
+                return i
+        return None
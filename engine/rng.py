@@ -0,0 +1,55 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+from random import SystemRandom
+
+MASK = (1 << 64) - 1
+
+
+class SplitMix64:
+    ''' The SplitMix64 generator (Steele, Lea and Flood). It is written
+    out here, rather than using the random module, so that a seed gives
+    the same numbers on every Python. '''
+
+    name = 'splitmix64'
+
+    def __init__(self, seed):
+        self.state = seed & MASK
+
+    def next(self):
+        ''' The next 64-bit number. '''
+        self.state = (self.state + 0x9E3779B97F4A7C15) & MASK
+        z = self.state
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+        return z ^ (z >> 31)
+
+    def randrange(self, n):
+        ''' A number from 0 to n - 1 (without modulo bias). '''
+        limit = (MASK + 1) - (MASK + 1) % n
+        while True:
+            z = self.next()
+            if z < limit:
+                return z % n
+
+# The generators, by name
+RNGS = {SplitMix64.name: SplitMix64}
+DEFAULT_RNG = SplitMix64.name
+
+
+def new_seed():
+    ''' A fresh (unpredictable) seed. '''
+    return SystemRandom().getrandbits(63)
+
+
+def get_rng(seed, name=DEFAULT_RNG):
+    ''' Return the generator called name, seeded with seed. '''
+    if name not in RNGS:
+        raise ValueError('unknown random number generator %s' % (name))
+    return RNGS[name](seed)
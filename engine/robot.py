@@ -0,0 +1,166 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+from math import log, sqrt
+from random import Random
+from time import time
+
+from .piece import ROTATIONS
+
+EXPLORATION = 10.0  # UCB1 exploration constant, in points
+
+
+class Robot:
+    ''' A robot player that chooses its moves by Monte Carlo search.
+
+    Each candidate move is played on a copy of the game. The rest of the
+    game is then played out at random for a few turns (depth), drawing
+    from a random ordering of the tiles still in the deck, since the
+    robot cannot see the real order. A playout is worth the points from
+    the paths it closes, plus the bonus (or less the penalty for the tiles
+    left in hand) if the game ends during the playout. Each playout is then undone, so the game is only copied once a move.
+    Playouts are shared out among the moves (UCB1) until the time budget
+    (in seconds) runs out; the move with the best average wins. '''
+
+    def __init__(self, budget=0.5, depth=6, seed=None):
+        self.budget = budget
+        self.depth = depth
+        self.random = Random(seed)
+        self.playouts = 0  # playouts run for the last move
+
+    def choose_move(self, state, hand, playouts=None):
+        ''' Return the best [piece, orientation, cell] for hand (or None).
+        At most playouts playouts are run, if given. '''
+        search = self.search(state, hand, playouts)
+        search.run(self.budget)
+        return search.best()
+
+    def search(self, state, hand, playouts=None):
+        ''' Start a search for the best move for hand, to be run a slice
+        at a time (e.g., so that a display can be kept up to date). '''
+        return Search(self, state, hand, playouts)
+
+    def candidates(self, state, hand):
+        ''' The legal moves, without rotations or tiles that are the same
+        as another move, most valuable tiles first. '''
+        moves = []
+        seen = set()
+        for piece, orientation, cell in state.legal_moves(hand):
+            key = (ROTATIONS[piece.type][int(orientation / 90)], cell)
+            if key not in seen:
+                seen.add(key)
+                moves.append([piece, orientation, cell])
+        moves.sort(key=lambda move: -move[0].value)
+        return moves
+
+    def _select(self, totals, counts):
+        ''' Try every move once, then pick by UCB1. '''
+        n = 0
+        for i, count in enumerate(counts):
+            if count == 0:
+                return i
+            n += count
+        best = 0
+        best_bound = None
+        for i, count in enumerate(counts):
+            bound = totals[i] / count + EXPLORATION * sqrt(2 * log(n) / count)
+            if best_bound is None or bound > best_bound:
+                best = i
+                best_bound = bound
+        return best
+
+    def _playout(self, game, which_hand, move):
+        ''' Play move on game (a copy of the state), play on at random,
+        then undo it all. '''
+        hand = game.hands[which_hand]
+        deck = game.deck
+        start = game.score
+        mark = len(game.undo_stack)
+        game.play(deck.by_number[move[0].number], move[1], move[2], hand)
+
+        # The robot does not know the order of the tiles left in the deck.
+        unseen = deck.pieces[deck.index:]
+        self.random.shuffle(unseen)
+        deck.pieces[deck.index:] = unseen
+
+        over = False
+        for turn in range(self.depth):
+            if hand.tiles_in_hand() == 0:
+                if deck.empty():
+                    over = True
+                    break
+                game.deal(hand)
+            moves = game.legal_moves(hand)
+            if len(moves) == 0:  # Nowhere to play: the game is over.
+                over = True
+                break
+            piece, orientation, cell = moves[
+                self.random.randrange(len(moves))]
+            game.play(piece, orientation, cell, hand)
+        else:
+            over = hand.tiles_in_hand() == 0 and deck.empty()
+        points = game.score - start
+        # The bonus or penalty only counts if the game is over.
+        if over:
+            points += game.game_over_points(hand)
+        while len(game.undo_stack) > mark:
+            game.undo()
+        return points
+
+
+class Search:
+    ''' A search for the best move, which can be run in slices: run it
+    until it returns True, then take best(). Only the time spent running
+    counts against the budget of the robot. The state must not change
+    while the search is under way. '''
+
+    def __init__(self, robot, state, hand, playouts=None):
+        self.robot = robot
+        self.moves = robot.candidates(state, hand)
+        self.limit = playouts
+        self.spent = 0.0  # seconds run so far
+        robot.playouts = 0
+        self.totals = [0.0] * len(self.moves)
+        self.counts = [0] * len(self.moves)
+        if len(self.moves) > 1:
+            self.which_hand = state.hands.index(hand)
+            self.game = state.copy()
+
+    def done(self):
+        ''' Is there nothing left to search? '''
+        return len(self.moves) < 2 or self.spent >= self.robot.budget or \
+            (self.limit is not None and self.robot.playouts >= self.limit)
+
+    def run(self, seconds):
+        ''' Run playouts for up to seconds (or the rest of the budget);
+        return True once the search is done. '''
+        robot = self.robot
+        start = time()
+        deadline = start + min(seconds, robot.budget - self.spent)
+        while not self.done() and time() < deadline:
+            i = robot._select(self.totals, self.counts)
+            self.totals[i] += robot._playout(self.game, self.which_hand,
+                                             self.moves[i])
+            self.counts[i] += 1
+            robot.playouts += 1
+        self.spent += time() - start
+        return self.done()
+
+    def best(self):
+        ''' The best [piece, orientation, cell] found (or None). '''
+        if len(self.moves) == 0:
+            return None
+        totals = self.totals
+        counts = self.counts
+        best = 0  # Moves are ordered best guess first.
+        for i in range(len(self.moves)):
+            if counts[i] > 0 and (counts[best] == 0 or
+               totals[i] / counts[i] > totals[best] / counts[best]):
+                best = i
+        return self.moves[best]
@@ -0,0 +1,184 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+
+from constants import ROW, COL, HAND_SIZE
+from .board import Board
+from .deck import Deck
+from .hand import Hand
+
+BONUS = 50  # for playing every tile in your hand
+PENALTY = 2  # times the value of each tile left in your hand
+
+# The changes kept in the undo stack
+PLAY = 0
+ROTATE = 1
+DEAL = 2
+
+
+class GameState:
+    ''' The rules of the game: the board, the deck, the hands and the
+    score.
+
+    The changes made through play, rotate and deal can be undone (and
+    redone). Each entry in the undo stack holds just what is needed to
+    reverse one change, so undo never rescans the board. '''
+
+    def __init__(self, rows=ROW, cols=COL, hand_size=HAND_SIZE):
+        self.board = Board(rows, cols)
+        self.deck = Deck(rows * cols)
+        self.hand_size = hand_size
+        self.hands = []
+        self.score = 0
+        self.bonus = BONUS
+        self.penalty = PENALTY
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def copy(self):
+        ''' Return an independent copy of the game, e.g., for a robot to
+        search. '''
+        state = GameState(self.board.rows, self.board.cols, self.hand_size)
+        state.deck = self.deck.copy()
+        state.board = self.board.copy(state.deck)
+        for hand in self.hands:
+            state.hands.append(hand.copy(state.deck))
+        state.score = self.score
+        state.bonus = self.bonus
+        state.penalty = self.penalty
+        return state
+
+    def add_hand(self, hand=None):
+        ''' Add a hand (a new one unless one is given). '''
+        if hand is None:
+            hand = Hand(self.hand_size)
+        self.hands.append(hand)
+        return hand
+
+    def clear(self):
+        ''' Reset everything for a new game. '''
+        for piece in self.deck.pieces:
+            piece.reset()
+        self.board.clear()
+        for hand in self.hands:
+            hand.clear()
+        self.score = 0
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def legal_moves(self, hand):
+        ''' Return every [piece, orientation, cell] playable from hand. '''
+        return self.board.legal_moves(hand.slots)
+
+    def place(self, piece, cell, hand=None):
+        ''' Move piece onto the board (from hand, if given). '''
+        if hand is not None:
+            i = hand.index(piece)
+            if i is not None:
+                hand.set_tile(i, None)
+        self.board.place(cell, piece)
+
+    def play(self, piece, orientation, cell, hand=None, score=True):
+        ''' Play piece at orientation in cell and score it (unless score
+        is False); return the points scored. '''
+        points = self.score
+        if hand is None:
+            slot = None
+        else:
+            slot = hand.index(piece)
+        change = [PLAY, piece, piece.orientation, orientation, cell, hand,
+                  slot, 0]
+        piece.set_orientation(orientation)
+        self.place(piece, cell, hand)
+        if score:
+            self.score_paths(cell)
+        else:
+            self.board.complete_paths(None)
+        change[7] = self.score - points
+        self._done(change)
+        return change[7]
+
+    def rotate(self, piece, orientation):
+        ''' Turn a piece (one not yet played) to orientation. '''
+        self._done([ROTATE, piece, piece.orientation, orientation])
+        piece.set_orientation(orientation)
+
+    def deal(self, hand, number=None):
+        ''' Deal tiles from the deck into hand; return the slots dealt
+        to. '''
+        self._done([DEAL, hand, hand.slots[:], self.deck.index])
+        return hand.deal(self.deck, number)
+
+    def _done(self, change):
+        self.undo_stack.append(change)
+        del self.redo_stack[:]
+
+    def undo(self):
+        ''' Undo the last change; return False if there is none. '''
+        if len(self.undo_stack) == 0:
+            return False
+        change = self.undo_stack.pop()
+        if change[0] == PLAY:
+            kind, piece, old, orientation, cell, hand, slot, points = change
+            self.board.remove(cell)
+            if slot is not None:
+                hand.set_tile(slot, piece)
+            piece.set_orientation(old)
+            self.score -= points
+        elif change[0] == ROTATE:
+            change[1].set_orientation(change[2])
+        else:
+            self._swap_deal(change)
+        self.redo_stack.append(change)
+        return True
+
+    def redo(self):
+        ''' Redo the last change undone; return False if there is none.
+        '''
+        if len(self.redo_stack) == 0:
+            return False
+        change = self.redo_stack.pop()
+        if change[0] == PLAY:
+            kind, piece, old, orientation, cell, hand, slot, points = change
+            piece.set_orientation(orientation)
+            self.place(piece, cell, hand)
+            self.board.complete_paths(None)  # (already scored)
+            self.score += points
+        elif change[0] == ROTATE:
+            change[1].set_orientation(change[3])
+        else:
+            self._swap_deal(change)
+        self.undo_stack.append(change)
+        return True
+
+    def _swap_deal(self, change):
+        ''' Swap the hand and deck index for those from before (or after)
+        a deal. '''
+        hand = change[1]
+        hand.slots[:], change[2] = change[2], hand.slots[:]
+        self.deck.index, change[3] = change[3], self.deck.index
+
+    def score_paths(self, cell):
+        ''' Score any paths closed by the tile in cell; return them. '''
+        closed = self.board.complete_paths(cell)
+        for members in closed:
+            for here, path in members:
+                self.score += self.board.cells[here].value
+        return closed
+
+    def game_over_points(self, hand):
+        ''' The bonus for an empty hand or the penalty for the tiles
+        remaining in it. '''
+        if hand.tiles_in_hand() == 0:
+            return self.bonus
+        return -self.penalty * hand.value()
+
+    def score_game_over(self, hand):
+        ''' Add the bonus or penalty at the end of the game. '''
+        self.score += self.game_over_points(hand)
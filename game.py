@@ -11,6 +11,7 @@
 # Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
 
 from gettext import gettext as _
+from random import randrange
 
 import logging
 _logger = logging.getLogger('paths-activity')
@@ -21,24 +22,28 @@ GRID_CELL_SIZE = style.GRID_CELL_SIZE
 from gi.repository import Gtk
 from gi.repository import Gdk
 from gi.repository import GObject
+from gi.repository import GLib
 
+import engine
 from grid import Grid
 from hand import Hand
 from deck import Deck
 from tile import error_graphic, highlight_graphic, blank_tile
 from utils import json_dump
-from constants import ROW, COL, NORTH, EAST, SOUTH, WEST, TILE_WIDTH, \
-    TILE_HEIGHT, HIDE, BOARD, GRID, TILES, TOP, OVER_THE_TOP
+from constants import ROW, COL, TILE_WIDTH, TILE_HEIGHT, HIDE, BOARD, GRID, \
+    TILES, TOP, OVER_THE_TOP
 from sprites import Sprites
 
-OFFSETS = [-COL, 1, COL, -1]
 MY_HAND = 0
 ROBOT_HAND = 1
+ROBOT_BUDGET = 0.5  # seconds the robot may think about a move
+ROBOT_SLICE = 0.02  # seconds the robot thinks between redraws
 
 
-class Game():
+class Game(object):
 
-    def __init__(self, canvas, parent=None, colors=['#A0FFA0', '#FF8080']):
+    def __init__(self, canvas, parent=None, colors=['#A0FFA0', '#FF8080'],
+                 rows=ROW, cols=COL):
         self._activity = parent
         self.colors = colors
 
@@ -63,35 +68,56 @@ class Game():
 
         self._width = Gdk.Screen.width()
         self._height = Gdk.Screen.height() - (GRID_CELL_SIZE * 1.5)
-        self._scale = self._height / (8.0 * TILE_HEIGHT)
+        self.robot = engine.Robot(budget=ROBOT_BUDGET)
+        self.moves = engine.MoveLog()
+
+        # and initialize a few variables we'll need.
+        self.buddies = []
+        self._my_hand = MY_HAND
+        self.playing_with_robot = False
+        self._setup_board(rows, cols)
+
+    def _setup_board(self, rows, cols):
+        ''' Make the models and sprites for a rows x cols board. '''
+        self.rows = rows
+        self.cols = cols
+        self._scale = self._height / (float(rows) * TILE_HEIGHT)
         self.tile_width = TILE_WIDTH * self._scale
         self.tile_height = TILE_HEIGHT * self._scale
 
+        # The rules of the game...
+        self.state = engine.GameState(rows, cols)
+
         # Generate the sprites we'll need...
         self._sprites = Sprites(self._canvas)
+        # The board, the grid and the placed tiles change once a turn.
+        self._sprites.set_background_layer(TILES)
         self.grid = Grid(self._sprites, self._width, self._height,
                          self.tile_width, self.tile_height, self._scale,
-                         colors[0])
-        self.deck = Deck(self._sprites, self._scale, colors[1])
+                         self.colors[0], model=self.state.board)
+        self.deck = Deck(self._sprites, self._scale, self.colors[1],
+                         model=self.state.deck, rows=rows, cols=cols)
         self.deck.board.move((self.grid.left, self.grid.top))
         self.hands = []
-        self.hands.append(Hand(self.tile_width, self.tile_height))
+        self.add_hand(remote=False)
         self._errormsg = []
         for i in range(4):
             self._errormsg.append(error_graphic(self._sprites))
         self._highlight = highlight_graphic(self._sprites, self._scale)
         self._score_card = blank_tile(self._sprites, scale=self._scale * 2,
-                                      color=colors[1])
+                                      color=self.colors[1])
         self._score_card.set_label_attributes(64)
         self._score_card.move(((int(self._width / 2) - self.tile_width),
                                int(self._height / 2) - self.tile_height))
-
-        # and initialize a few variables we'll need.
-        self.buddies = []
-        self._my_hand = MY_HAND
-        self.playing_with_robot = False
         self._all_clear()
 
+    def set_board_size(self, rows, cols):
+        ''' Start over on a rows x cols board (with the same players). '''
+        if rows == self.rows and cols == self.cols:
+            return
+        self._setup_board(rows, cols)
+        self._canvas.queue_draw()
+
     def _all_clear(self):
         ''' Things to reinitialize when starting up a new game. '''
         self._hide_highlight()
@@ -101,6 +127,8 @@ class Game():
         self.grid.clear()
         for hand in self.hands:
             hand.clear()
+        self.moves.clear()
+        self.state.clear()
         self.show_connected_tiles()
 
         self._press = None
@@ -111,10 +139,17 @@ class Game():
         self._last_tile_played = None
         self._last_tile_orientation = 0
         self._last_grid_played = None
+        self._last_slot_played = None
+        # Where each turn starts in the undo stack (and the paths that my
+        # tile completed in that turn)
+        self._turn_start = 0
+        self._undo_marks = []
+        self._redo_marks = []
 
         self.whos_turn = MY_HAND
         self._waiting_for_my_turn = False
         self._waiting_for_robot = False
+        self._robot_search = None
         self.placed_a_tile = False
         self._there_are_errors = False
 
@@ -124,6 +159,27 @@ class Game():
                                int(self._height / 2) - self.tile_height))
         self.saw_game_over = False
 
+    @property
+    def score(self):
+        return self.state.score
+
+    @score.setter
+    def score(self, score):
+        self.state.score = score
+
+    def add_hand(self, remote=True):
+        ''' Add a hand (for a robot or a buddy if remote) to the game. '''
+        hand = Hand(self.tile_width, self.tile_height, remote=remote)
+        self.hands.append(hand)
+        self.state.add_hand(hand.model)
+        return hand
+
+    def _deal(self, i, number=None):
+        ''' Deal tiles into hand i (through the rules, so that the deal
+        can be undone). '''
+        self.state.deal(self.hands[i].model, number)
+        self.hands[i].sync(self.deck)
+
     def _initiating(self):
         if not self._running_sugar:
             return True
@@ -137,30 +193,29 @@ class Game():
         if not self.we_are_sharing() or self._initiating():
             # Let joiners know we are starting a new game...
             if self.we_are_sharing():
-                self._activity.send_event("n", " ")
+                self._activity.send_event("n", json_dump([self.rows,
+                                                         self.cols]))
 
             # The initiator shuffles the deck...
             self.deck.shuffle()
-            # ...and shares it.
+            # ...and shares the seed, so everyone can shuffle it the same.
             if self.we_are_sharing():
-                self._activity.send_event("d", self.deck.serialize())
+                self._activity.send_event("d", self.deck.serialize_seed())
 
             # Deal a hand to yourself...
-            self.hands[self._my_hand].deal(self.deck)
+            self._deal(self._my_hand)
 
             # ...deal a hand to the robot...
             if self.playing_with_robot:
                 if len(self.hands) < ROBOT_HAND + 1:
-                    self.hands.append(Hand(self.tile_width, self.tile_height,
-                                           remote=True))
-                self.hands[ROBOT_HAND].deal(self.deck)
+                    self.add_hand()
+                self._deal(ROBOT_HAND)
             # ...or deal hands to the joiners.
             elif len(self.buddies) > 1:
                 for i, buddy in enumerate(self.buddies):
                     if buddy != self._activity.nick:
-                        self.hands.append(Hand(
-                            self.tile_width, self.tile_height, remote=True))
-                        self.hands[i].deal(self.deck)
+                        self.add_hand()
+                        self._deal(i)
                         self._activity.send_event("h",
                             self.hands[i].serialize(buddy=buddy))
 
@@ -194,6 +249,7 @@ class Game():
         # If I don't have any tiles left, time to redeal.
         if self.hands[self._my_hand].tiles_in_hand() == 0:
             self._redeal()
+        self._turn_start = len(self.state.undo_stack)
         if self._running_sugar:
             self._activity.set_player_on_toolbar(self._activity.nick)
             self._activity.dialog_button.set_icon_name('go-next')
@@ -204,9 +260,9 @@ class Game():
     def _redeal(self):
         # Only the sharer deals tiles.
         if not self.we_are_sharing():
-            self.hands[self._my_hand].deal(self.deck)
+            self._deal(self._my_hand)
             if self.playing_with_robot:
-                self.hands[ROBOT_HAND].deal(self.deck)
+                self._deal(ROBOT_HAND)
             if self.hands[self._my_hand].tiles_in_hand() == 0:
                 if self._running_sugar:
                     self._activity.dialog_button.set_icon_name(
@@ -217,15 +273,16 @@ class Game():
             if self.deck.empty():
                 self.game_over()
                 return
-            if self.deck.tiles_remaining() < COL * len(self.buddies):
+            if self.deck.tiles_remaining() < \
+               self.state.hand_size * len(self.buddies):
                 number_of_tiles_to_deal = \
                     int(self.deck.tiles_remaining() / len(self.buddies))
                 if number_of_tiles_to_deal == 0:
                     number_of_tiles_to_deal = 1  # Deal last tile in deck.
             else:
-                number_of_tiles_to_deal = COL
+                number_of_tiles_to_deal = self.state.hand_size
             for i, nick in enumerate(self.buddies):
-                self.hands[i].deal(self.deck, number_of_tiles_to_deal)
+                self._deal(i, number_of_tiles_to_deal)
                 # Send the joiners their new hands.
                 if nick != self._activity.nick:
                     self._activity.send_event("h",
@@ -237,11 +294,17 @@ class Game():
             self._set_label(_('There are errors—it is still your turn.'))
             return
 
+        # Play the tile (and score any paths it completes).
+        points = self._play_my_tile(self._last_grid_played)
+
         # After the tile is placed, expand regions of playable grid squares.
         self.show_connected_tiles()
 
         # Are there any completed paths?
-        self._test_for_complete_paths(self._last_grid_played)
+        closed = self._test_for_complete_paths(self._last_grid_played)
+        self.log_move(self._last_grid_played, points)
+        self._undo_marks.append([self._turn_start, closed])
+        del self._redo_marks[:]
 
         # If so, let everyone know what piece I moved.
         if self.we_are_sharing():
@@ -261,7 +324,7 @@ class Game():
         if self.playing_with_robot:
             self.its_their_turn(_('robot'))
             self._waiting_for_robot = True
-            gobject.timeout_add(1000, self._robot_turn)
+            GObject.timeout_add(1000, self._robot_turn)
         elif not self.we_are_sharing():
             if self.deck.empty() and \
                self.hands[self._my_hand].tiles_in_hand() == 0:
@@ -276,11 +339,41 @@ class Game():
                 self.its_their_turn(self.buddies[self.whos_turn])
                 self._activity.send_event("t", self.buddies[self.whos_turn])
 
+    def _play_my_tile(self, i):
+        ''' The tile placed in grid[i] this turn is played: it goes back
+        to its slot in the hand and is played from there, so that the move
+        can be undone. Return the points scored. '''
+        hand = self.hands[self._my_hand].model
+        piece = self.state.board.remove(i)
+        slot = self._last_slot_played
+        if slot is None or hand.slots[slot] is not None:
+            slot = hand.find_empty_slot()
+        hand.set_tile(slot, piece)
+        return self.state.play(piece, piece.orientation, i, hand)
+
     def _robot_turn(self):
-        self._robot_play()
+        ''' Start the robot thinking about its move. It thinks a slice at
+        a time when GTK is idle, so that the board stays responsive. '''
+        if not self._waiting_for_robot:  # A new game was started.
+            return False
+        self._robot_search = self.robot.search(self.state,
+                                               self.hands[ROBOT_HAND].model)
+        GLib.idle_add(self._robot_think, self._robot_search)
+        return False  # Don't run again as a GObject timeout.
+
+    def _robot_think(self, search):
+        ''' Think for another slice; play once the search is done. '''
+        if search is not self._robot_search:  # A new game was started.
+            return False
+        if not search.run(ROBOT_SLICE):
+            return True  # Think some more when GTK is idle again.
+        self._robot_search = None
+        self._robot_play(search.best())
         self.show_connected_tiles()
         if not self._waiting_for_robot:
             self.its_my_turn()
+        self._canvas.queue_draw()
+        return False
 
     def its_their_turn(self, nick):
         # It is someone else's turn.
@@ -378,10 +471,10 @@ class Game():
                 # If the tile was previously in the grid, empty its old pos.
                 i = self.grid.spr_to_grid(self._press)
                 if i is not None:
-                    self.grid.grid[i] = None
+                    self.grid.set_tile(i, None)
 
                 # Assign the tile to the new grid position.
-                self.grid.grid[grid_pos] = tile
+                self.grid.set_tile(grid_pos, tile)
                 self.placed_a_tile = True
                 self._last_tile_played = tile.number
                 self._last_grid_played = grid_pos
@@ -389,7 +482,8 @@ class Game():
                 # If the tile came from the hand, empty its old position.
                 i = self.hands[self._my_hand].spr_to_hand(self._press)
                 if i is not None:
-                    self.hands[self._my_hand].hand[i] = None
+                    self.hands[self._my_hand].set_tile(i, None)
+                    self._last_slot_played = i
 
                 # Remember which tile moved.
                 if self.last_spr_moved != tile.spr:
@@ -404,14 +498,15 @@ class Game():
                 tile = self.deck.spr_to_tile(self._press)
                 tile.spr.move(self.hands[self._my_hand].hand_to_xy(empty))
                 # Did the tile come from elsewhere in the hand?
-                if self.hands[self._my_hand].spr_to_hand(
-                    self._press) is not None:
-                    self.hands[self._my_hand].hand[self.hands[
-                            self._my_hand].spr_to_hand(self._press)] = None
+                i = self.hands[self._my_hand].spr_to_hand(self._press)
+                if i is not None:
+                    self.hands[self._my_hand].set_tile(i, None)
                 # or from the grid?
-                elif self.grid.spr_to_grid(self._press) is not None:
-                    self.grid.grid[self.grid.spr_to_grid(self._press)] = None
-                self.hands[self._my_hand].hand[empty] = tile
+                else:
+                    i = self.grid.spr_to_grid(self._press)
+                    if i is not None:
+                        self.grid.set_tile(i, None)
+                self.hands[self._my_hand].set_tile(empty, tile)
 
                 # Remember which tile moved.
                 if spr == self.last_spr_moved:
@@ -433,7 +528,10 @@ class Game():
         # Rotate
         elif self._press == self._release and not self._it_is_a_drag():
             tile = self.deck.spr_to_tile(spr)
-            tile.rotate_clockwise()
+            orientation = (tile.orientation + 90) % 360
+            self.state.rotate(tile.piece, orientation)
+            tile.set_orientation(orientation)
+            del self._redo_marks[:]
             self._last_tile_orientation = tile.orientation
 
             # Remember which tile moved.
@@ -457,10 +555,11 @@ class Game():
 
     def _snap_to_grid(self, spr):
         ''' make sure a tile is aligned in its grid position '''
-        for i in range(COL * ROW):
-            if self.grid.grid[i] is not None:
+        for s in (self._press, spr):
+            i = self.grid.spr_to_grid(s)
+            if i is not None:
                 self.grid.grid[i].spr.move(self.grid.grid_to_xy(i))
-                if self.grid.grid[i].spr == spr:
+                if s == spr:
                     self._move_highlight(self.grid.grid_to_xy(i))
 
     def _it_is_a_drag(self):
@@ -478,19 +577,16 @@ class Game():
             empty = self.hands[hand].find_empty_slot()
             if i > 0 and tile is not None and empty is not None:
                 tile.spr.move(self.hands[hand].hand_to_xy(empty))
-                self.hands[hand].hand[empty] = tile
-                self.hands[hand].hand[i] = None
+                self.hands[hand].set_tile(empty, tile)
+                self.hands[hand].set_tile(i, None)
 
     def game_over(self, msg=_('Game over')):
         ''' Nothing left to do except show the results. '''
         self._set_label(msg)
         self.saw_game_over = True
-        if self.hands[self._my_hand].tiles_in_hand() == 0:
-            self.score += 50  # Bonus points
-        else:
-            for tile in self.hands[self._my_hand].hand:
-                if tile is not None:
-                    self.score -= 2 * tile.get_value()  # Penalty
+        # Bonus points or penalty
+        self.state.score_game_over(self.hands[self._my_hand].model)
+        if self.hands[self._my_hand].tiles_in_hand() > 0:
             self._shuffle_up(self._my_hand)
         if self._running_sugar:
             self._activity.score.set_label(_('Score: ') + str(self.score))
@@ -500,7 +596,7 @@ class Game():
                                int(self._height / 2) + 2 * self.tile_height))
         if self.playing_with_robot:
             self._shuffle_up(ROBOT_HAND)
-            for tile in range(COL):
+            for tile in range(self.hands[ROBOT_HAND].size):
                 if self.hands[ROBOT_HAND].hand[tile] is not None:
                     x, y = self.hands[ROBOT_HAND].hand_to_xy(tile)
                     self.hands[ROBOT_HAND].hand[tile].spr.move(
@@ -512,206 +608,160 @@ class Game():
 
     def show_connected_tiles(self):
         ''' Highlight the squares that surround the tiles already on the grid.
-        '''
-        for i in range(ROW * COL):
+        Only the squares whose status has changed are touched. '''
+        shown = []
+        hidden = []
+        for i in self.state.board.frontier_changes():
             if self._connected(i):
-                self.grid.blanks[i].set_layer(GRID)
+                shown.append(self.grid.blanks[i])
             else:
-                self.grid.blanks[i].set_layer(HIDE)
+                hidden.append(self.grid.blanks[i])
+        self._sprites.set_layers(shown, GRID)
+        self._sprites.set_layers(hidden, HIDE)
 
     def _connected(self, tile):
         ''' Does tile abut the path? '''
-        if self.grid.grid.count(None) == ROW * COL:
-            return True
-        if self.grid.grid[tile] is not None:  # already has a tile
-            return False
-        # Looking north
-        if tile >= COL and self.grid.grid[tile + OFFSETS[0]] is not None:
-            return True
-        # Looking east
-        if tile % ROW < ROW - 1 and \
-           self.grid.grid[tile + OFFSETS[1]] is not None:
-            return True
-        # Looking south
-        if tile < (ROW - 1) * COL and \
-           self.grid.grid[tile + OFFSETS[2]] is not None:
-            return True
-        # Looking west
-        if tile % ROW > 0 and self.grid.grid[tile + OFFSETS[3]] is not None:
-            return True
-        return False
+        return self.state.board.connected(tile)
 
     def give_a_hint(self):
         ''' Try to find an open place on the grid for any tile in my_hand. '''
-        order = self.deck.random_order(ROW * COL)
-        for i in range(ROW * COL):
-            if self._connected(order[i]):
-                for tile in self.hands[self._my_hand].hand:
-                    if self._try_placement(tile, order[i]):
-                        # Success, so give hint.
-                        self.grid.grid[order[i]] = None
-                        self._show_highlight(
-                            pos=self.grid.grid_to_xy(order[i]))
-                        return
+        moves = self.state.legal_moves(self.hands[self._my_hand].model)
+        if len(moves) > 0:
+            piece, orientation, cell = moves[randrange(len(moves))]
+            self._show_highlight(pos=self.grid.grid_to_xy(cell))
+            return
         # Nowhere to play.
         self.game_over(_('Nowhere to play.'))
 
-    def _robot_play(self):
-        ''' The robot tries random tiles in random locations. '''
-        # TODO: strategy try to complete paths
-        order = self.deck.random_order(ROW * COL)
-        for i in range(ROW * COL):
-            if self._connected(order[i]):
-                for tile in self.hands[ROBOT_HAND].hand:
-                    if self._try_placement(tile, order[i]):
-                        # Success, so remove tile from hand.
-                        self.hands[ROBOT_HAND].hand[
-                            self.hands[ROBOT_HAND].hand.index(tile)] = None
-                        tile.spr.move(self.grid.grid_to_xy(order[i]))
-                        tile.spr.set_layer(TILES)
-                        self._waiting_for_robot = False
-                        return
+    def _robot_play(self, move):
+        ''' The robot plays the move it chose (or None if it has none). '''
+        if move is not None:
+            piece, orientation, cell = move
+            # Play the tile from the hand (the robot does not score).
+            self.state.play(piece, orientation, cell,
+                            self.hands[ROBOT_HAND].model, score=False)
+            self.hands[ROBOT_HAND].sync(self.deck)
+            self.grid.sync(cell, self.deck)
+            self.log_move(cell)
+            self._waiting_for_robot = False
+            return
 
         # If we didn't return above, we were unable to play a tile.
         self.game_over(_('Robot unable to play'))
 
-    def _try_placement(self, tile, i):
-        ''' Try to place a tile at grid posiion i. Rotate it, if necessary. '''
-        if tile is None:
-            return False
-        self.grid.grid[i] = tile
-        for j in range(4):
-            self._test_for_bad_paths(i)
-            if not self._there_are_errors:
-                return True
-            tile.rotate_clockwise()
-        self.grid.grid[i] = None
-        return False
+    def pending_move(self):
+        ''' Where is the tile placed this turn but not yet played? '''
+        if self.placed_a_tile and not self._waiting_for_my_turn and \
+           self.grid.grid[self._last_grid_played] is not None:
+            return self._last_grid_played
+        return None
+
+    def place_pending(self, tile_number, orientation, i):
+        ''' Put back a tile placed (but not yet played) before a save. '''
+        self.grid.add_tile_to_grid(tile_number, orientation, i, self.deck)
+        self.placed_a_tile = True
+        self._last_tile_played = tile_number
+        self._last_grid_played = i
+
+    def log_move(self, i, points=0):
+        ''' Add the tile played in grid[i] to the move log. '''
+        tile = self.grid.grid[i]
+        self.moves.append(tile.number, tile.orientation, i, points)
 
     def _test_for_complete_paths(self, tile):
-        ''' Did this tile complete a path? (or two paths?) '''
-
-        # A tile can complete up to two paths.
-        self._paths = [[], []]
-        break_in_path = [False, False]
-
-        # Seed the paths and lists with the current tile.
-        if tile is not None:
-            self._add_to_path_list(tile, 0, 0)
-            if len(self.grid.grid[tile].paths) == 2:
-                self._add_to_path_list(tile, 1, 1)
-
-        # Walk the path.
-        for p in range(2):
-            tile, path = self._tile_to_test(p)
-            while(tile is not None):
-                self._test(tile, path, p, self._test_a_neighbor)
-                self._tile_has_been_tested(tile, path, p)
-                tile, path = self._tile_to_test(p)
-            # Is the path complete?
-            for i in self._paths[p]:
-                if not self._test(i[0], i[1], None, self._test_a_connection):
-                    break_in_path[p] = True
-            if not break_in_path[p] and len(self._paths[p]) > 0:
-                for i in self._paths[p]:
-                    self.grid.grid[i[0]].set_shape(i[1])
-                    self.score += self.grid.grid[i[0]].get_value()
-
-    def _tile_to_test(self, test_path):
-        ''' Find a tile that needs testing. '''
-        for i in self._paths[test_path]:
-            if i[2] is False:
-                return i[0], i[1]
-        return None, None
-
-    def _add_to_path_list(self, tile, tile_path, test_path):
-        ''' Only add a tile to the path if it is not already there. '''
-        for i in self._paths[test_path]:
-            if i[0] == tile and i[1] == tile_path:
-                return
-        self._paths[test_path].append([tile, tile_path, False])
-
-    def _tile_has_been_tested(self, tile, tile_path, test_path):
-        ''' Mark a tile as tested. '''
-        for i in self._paths[test_path]:
-            if i[0] == tile and i[1] == tile_path:
-                i[2] = True
-                return
-
-    def _test(self, tile, tile_path, test_path, test):
-        ''' Test each neighbor of a block for a connecting path. '''
-        if tile is None:
+        ''' Did this tile complete a path? (or two paths?) Return them. '''
+        closed = []
+        for members in self.state.board.complete_paths(tile):
+            for i, path in members:
+                self.grid.grid[i].set_shape(path)
+            closed.append(members[:])  # (the board goes on using members)
+        return closed
+
+    def can_undo(self):
+        ''' Turns can be taken back in solo and robot games, between turns
+        (i.e., with no tile placed but not yet played). '''
+        return not self.we_are_sharing() and not self.saw_game_over and \
+            not self._waiting_for_robot and not self.placed_a_tile and \
+            not self._waiting_for_my_turn
+
+    def undo(self):
+        ''' Take back my last turn (and the robot's reply). '''
+        if not self.can_undo() or len(self._undo_marks) == 0:
             return False
-        for i in range(4):
-            if not test(tile, tile_path, test_path, i, tile + OFFSETS[i]):
-                return False
+        stack = self.state.undo_stack
+        start, closed = self._undo_marks.pop()
+        self._redo_marks.append([len(stack), closed])
+        changes = stack[start:]
+        while len(stack) > start:
+            self.state.undo()
+            if self.state.redo_stack[-1][0] == engine.state.PLAY:
+                self.moves.pop()
+        self._show_changes(changes, closed)
         return True
 
-    def _test_a_connection(self, tile, tile_path, test_path, direction,
-                           neighbor):
-        ''' Is there a break in the connection? If so return False. '''
-        if self.grid.grid[tile].paths[tile_path][direction] == 1:
-            if self.grid.grid[neighbor] is None:
-                return False
-            # Which of the neighbor's paths are we connecting to?
-            if len(self.grid.grid[neighbor].paths) == 1:
-                if self.grid.grid[neighbor].paths[0][(direction + 2) % 4] == 0:
-                    return False
-                else:
-                    return True
-            if self.grid.grid[neighbor].paths[0][(direction + 2) % 4] == 0 and\
-               self.grid.grid[neighbor].paths[1][(direction + 2) % 4] == 0:
-                return False
+    def redo(self):
+        ''' Take the last turn taken back again. '''
+        if not self.can_undo() or len(self._redo_marks) == 0:
+            return False
+        if len(self.state.redo_stack) == 0:  # Something else was done.
+            del self._redo_marks[:]
+            return False
+        stack = self.state.undo_stack
+        end, closed = self._redo_marks.pop()
+        self._undo_marks.append([len(stack), closed])
+        changes = self.state.redo_stack[len(stack) - end:]
+        while len(stack) < end and self.state.redo():
+            if stack[-1][0] == engine.state.PLAY:
+                kind, piece, old, orientation, cell, hand, slot, points = \
+                    stack[-1]
+                self.moves.append(piece.number, orientation, cell, points)
+        self._show_changes(changes, closed)
         return True
 
-    def _test_a_neighbor(self, tile, tile_path, test_path, direction,
-                         neighbor):
-        ''' Are we connected to a neighbor's path? If so, add the neighbor
-        to our paths list and to the list of tiles that need to be tested. '''
-        if self.grid.grid[tile].paths[tile_path][direction] == 1:
-            if self.grid.grid[neighbor] is not None:
-                if not neighbor in self._paths[test_path]:
-                    # Which of the neighbor's paths are we connecting to?
-                    if self.grid.grid[neighbor].paths[0][
-                        (direction + 2) % 4] == 1:
-                        self._add_to_path_list(neighbor, 0, test_path)
-                    elif len(self.grid.grid[neighbor].paths) == 2 and \
-                         self.grid.grid[neighbor].paths[1][
-                        (direction + 2) % 4] == 1:
-                        self._add_to_path_list(neighbor, 1, test_path)
-        return True
+    def _show_changes(self, changes, closed):
+        ''' Show the grid and the hands as the rules have them after an
+        undo (or redo) of changes, in which my tile completed the paths
+        closed. '''
+        tiles = []
+        for hand in self.hands:
+            tiles.extend([tile for tile in hand.hand if tile is not None])
+            hand.sync(self.deck)
+        for change in changes:
+            if change[0] == engine.state.PLAY:
+                self.grid.sync(change[4], self.deck)
+                self.deck.piece_to_tile(change[1]).clear_shape()
+        # Tiles dealt in the turns taken back go back into the deck.
+        held = [tile for hand in self.hands for tile in hand.hand]
+        for tile in tiles:
+            if tile not in held and self.grid.tile_to_grid(tile) is None:
+                tile.hide()
+        # Highlight the paths completed in the turns still taken.
+        cells = set([i for members in closed for i, path in members])
+        for i in cells:
+            if self.grid.grid[i] is not None:
+                self.grid.grid[i].clear_shape()
+        for start, turn_closed in self._undo_marks:
+            for members in turn_closed:
+                for i, path in members:
+                    if i in cells:
+                        self.grid.grid[i].set_shape(path)
+        self.show_connected_tiles()
+
+        self.last_spr_moved = None
+        self._last_slot_played = None
+        self._hide_highlight()
+        self._hide_errormsgs()
+        self._turn_start = len(self.state.undo_stack)
+        self._set_label(_('It is your turn.'))
+        self._canvas.queue_draw()
 
     def _test_for_bad_paths(self, tile):
         ''' Is there a path to nowhere? '''
         self._hide_errormsgs()
         self._there_are_errors = False
         if tile is not None:
-            self._check_tile(tile, [int(tile / COL), 0], NORTH,
-                             tile + OFFSETS[0])
-            self._check_tile(tile, [tile % ROW, ROW - 1], EAST,
-                             tile + OFFSETS[1])
-            self._check_tile(tile, [int(tile / COL), COL - 1], SOUTH,
-                             tile + OFFSETS[2])
-            self._check_tile(tile, [tile % ROW, 0], WEST, tile + OFFSETS[3])
-
-    def _check_tile(self, i, edge_check, direction, neighbor):
-        ''' Can a tile be placed at position i? '''
-        if edge_check[0] == edge_check[1]:
-            for path in self.grid.grid[i].paths:
-                if path[direction] == 1:
-                    self._display_errormsg(i, direction)
-        else:
-            if self.grid.grid[neighbor] is not None:
-                my_path = 0
-                your_path = 0
-                for c in self.grid.grid[i].paths:
-                    if c[direction] == 1:
-                        my_path = 1
-                for c in self.grid.grid[neighbor].paths:
-                    if c[(direction + 2) % 4] == 1:
-                        your_path = 1
-                if my_path != your_path:
-                    self._display_errormsg(i, direction)
+            for direction in self.state.board.bad_edges(tile):
+                self._display_errormsg(tile, direction)
 
     def _display_errormsg(self, i, direction):
         ''' Display an error message where and when appropriate. '''
@@ -763,6 +813,15 @@ class Game():
                 self._highlight[i].set_layer(OVER_THE_TOP)
 
     def _keypress_cb(self, area, event):
+        ''' Ctrl+Z takes back a turn and Ctrl+Y takes it again (from the
+        toolbar when running Sugar). '''
+        if not self._running_sugar and \
+           event.state & Gdk.ModifierType.CONTROL_MASK:
+            k = Gdk.keyval_name(event.keyval)
+            if k == 'z':
+                self.undo()
+            elif k == 'y':
+                self.redo()
         return True
 
     def _draw_cb(self, win, context):
@@ -14,6 +14,7 @@
 
 
 import os
+from math import pi
 
 
 class SVG:
@@ -78,10 +79,15 @@ class SVG:
             svg_string += self._svg_line(0, 0, 0, h)
         return svg_string
 
-    def _background(self, scale):
-        return self._svg_rect(54.5 * scale, 54.5 * scale, 4, 4, 0.25, 0.25)
+    def _background(self, scale, height_scale=None):
+        if height_scale is None:
+            height_scale = scale
+        return self._svg_rect(54.5 * scale, 54.5 * height_scale, 4, 4, 0.25,
+                              0.25)
 
-    def header(self, scale=1, background=True):
+    def header(self, scale=1, background=True, height_scale=None):
+        if height_scale is None:
+            height_scale = scale
         svg_string = "<?xml version=\"1.0\" encoding=\"UTF-8\""
         svg_string += " standalone=\"no\"?>\n"
         svg_string += "<!-- Created with Emacs -->\n"
@@ -91,13 +97,13 @@ class SVG:
         svg_string += "   version=\"1.0\"\n"
         svg_string += "%s%f%s" % ("   width=\"", scale * 55 * self._scale,
                                   "\"\n")
-        svg_string += "%s%f%s" % ("   height=\"", scale * 55 * self._scale,
-                                  "\">\n")
+        svg_string += "%s%f%s" % ("   height=\"",
+                                  height_scale * 55 * self._scale, "\">\n")
         svg_string += "%s%f%s%f%s" % ("<g\n       transform=\"matrix(",
                                       self._scale, ",0,0,", self._scale,
                                       ",0,0)\">\n")
         if background:
-            svg_string += self._background(scale)
+            svg_string += self._background(scale, height_scale)
         return svg_string
 
     def footer(self):
@@ -131,6 +137,78 @@ class SVG:
         svg_string = self._svg_line(x1, y1, x2, y2)
         return svg_string
 
+
+class CairoSVG(SVG):
+    ''' Draws the SVG primitives straight onto a cairo surface, with no
+    SVG to parse. The primitives return empty strings, so the card
+    generators can run unchanged; the result is in surface. (The XO
+    icon, which is an SVG path, is not supported.) '''
+
+    def __init__(self):
+        SVG.__init__(self)
+        self.surface = None
+        self._context = None
+
+    def header(self, scale=1, background=True, height_scale=None):
+        import cairo  # Only needed to draw.
+        if height_scale is None:
+            height_scale = scale
+        self.surface = cairo.ImageSurface(
+            cairo.FORMAT_ARGB32, int(scale * 55 * self._scale + 0.5),
+            int(height_scale * 55 * self._scale + 0.5))
+        self._context = cairo.Context(self.surface)
+        self._context.scale(self._scale, self._scale)
+        if background:
+            self._background(scale, height_scale)
+        return ''
+
+    def footer(self):
+        self.surface.flush()
+        return ''
+
+    def _set_color(self, color):
+        self._context.set_source_rgb(int(color[1:3], 16) / 255.,
+                                     int(color[3:5], 16) / 255.,
+                                     int(color[5:7], 16) / 255.)
+
+    def _fill_and_stroke(self):
+        cr = self._context
+        self._set_color(self._fill)
+        cr.fill_preserve()
+        self._set_color(self._stroke)
+        cr.set_line_width(self._stroke_width)
+        cr.stroke()
+
+    def _svg_line(self, x1, y1, x2, y2):
+        import cairo
+        cr = self._context
+        cr.move_to(x1, y1)
+        cr.line_to(x2, y2)
+        cr.set_line_cap(cairo.LINE_CAP_SQUARE)
+        self._fill_and_stroke()
+        cr.set_line_cap(cairo.LINE_CAP_BUTT)
+        return ''
+
+    def _svg_rect(self, w, h, rx, ry, x, y):
+        cr = self._context
+        rx = min(rx, w / 2.)
+        ry = min(ry, h / 2.)
+        cr.new_path()
+        # Each corner is a quarter of an rx by ry ellipse.
+        for cx, cy, start in [(x + w - rx, y + ry, -pi / 2),
+                              (x + w - rx, y + h - ry, 0),
+                              (x + rx, y + h - ry, pi / 2),
+                              (x + rx, y + ry, pi)]:
+            cr.save()
+            cr.translate(cx, cy)
+            cr.scale(rx, ry)
+            cr.arc(0, 0, 1, start, start + pi / 2)
+            cr.restore()
+        cr.close_path()
+        self.set_stroke_width(1.0)
+        self._fill_and_stroke()
+        return ''
+
 #
 # Card generators
 #
@@ -146,8 +224,9 @@ def generate_xo(scale=1, colors=["#FFFFFF", "#000000"]):
     return svg_string
 
 
-def generate_x(scale=1):
-    svg = SVG()
+def generate_x(scale=1, svg=None):
+    if svg is None:
+        svg = SVG()
     svg.set_scale(scale)
     svg.set_colors(["#FF0000", "#FF0000"])
     svg_string = svg.header(background=False)
@@ -156,8 +235,9 @@ def generate_x(scale=1):
     return svg_string
 
 
-def generate_corners(which_corner=0, scale=1):
-    svg = SVG()
+def generate_corners(which_corner=0, scale=1, svg=None):
+    if svg is None:
+        svg = SVG()
     svg.set_scale(scale)
     svg.set_colors(["#0000FF", "#0000FF"])
     svg_string = svg.header(background=False)
@@ -166,8 +246,9 @@ def generate_corners(which_corner=0, scale=1):
     return svg_string
 
 
-def generate_blank(scale=1, color='#A0FFA0'):
-    svg = SVG()
+def generate_blank(scale=1, color='#A0FFA0', svg=None):
+    if svg is None:
+        svg = SVG()
     svg.set_scale(scale)
     svg.set_colors([color, color])
     svg_string = svg.header()
@@ -175,17 +256,19 @@ def generate_blank(scale=1, color='#A0FFA0'):
     return svg_string
 
 
-def generate_board(scale=1, color='#000000'):
-    svg = SVG()
+def generate_board(scale=1, color='#000000', rows=8, cols=8, svg=None):
+    if svg is None:
+        svg = SVG()
     svg.set_scale(scale)
     svg.set_colors([color, '#FFFFFF'])
-    svg_string = svg.header(scale=8)  # board is 8x8 tiles
+    svg_string = svg.header(scale=cols, height_scale=rows)  # rows x cols tiles
     svg_string += svg.footer()
     return svg_string
 
 
-def generate_tile_1_line(a, b, c, d, scale=1, color='#000000'):
-    svg = SVG()
+def generate_tile_1_line(a, b, c, d, scale=1, color='#000000', svg=None):
+    if svg is None:
+        svg = SVG()
     svg.set_scale(scale)
     svg.set_colors([color, '#FFFFFF'])
     svg_string = svg.header()
@@ -195,8 +278,9 @@ def generate_tile_1_line(a, b, c, d, scale=1, color='#000000'):
 
 
 def generate_tile_2_lines(a, b, c, d, e, f, g, h, scale=1,
-                          colors=['#000000', '#000000']):
-    svg = SVG()
+                          colors=['#000000', '#000000'], svg=None):
+    if svg is None:
+        svg = SVG()
     svg.set_scale(scale)
     svg_string = svg.header()
     svg.set_colors([colors[0], '#FFFFFF'])
@@ -206,6 +290,14 @@ def generate_tile_2_lines(a, b, c, d, e, f, g, h, scale=1,
     svg_string += svg.footer()
     return svg_string
 
+
+def draw(generator, *args, **kwargs):
+    ''' Run a card generator on cairo rather than SVG; return the cairo
+    ImageSurface it drew. '''
+    svg = CairoSVG()
+    generator(*args, svg=svg, **kwargs)
+    return svg.surface
+
 #
 # Command line utilities used for testing purposed only
 #
@@ -10,76 +10,111 @@
 # Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
 
 
-from deck import Deck
+import engine
 from tile import blank_tile
-from utils import json_dump, json_load
+from codec import dump_grid, load
 from constants import ROW, COL, GRID, TILES
 
 
 class Grid:
-    ''' Class for managing ROWxCOL matrix of tiles '''
+    ''' Class for managing a rows x cols matrix of tiles '''
 
     def __init__(self, sprites, width, height, tile_width, tile_height, scale,
-                 color):
-        # the playing surface
+                 color, model=None):
+        # the playing surface (the engine Board holds the rules)
+        if model is None:
+            model = engine.Board(ROW, COL)
+        self.model = model
+        self._sprites = sprites
+        self.rows = model.rows
+        self.cols = model.cols
         self.grid = []
         self.blanks = []
+        # The cell that each tile on the grid is in, by its sprite
+        self._cells = {}
 
-        for i in range(ROW * COL):
+        for i in range(self.rows * self.cols):
             self.grid.append(None)
 
         # tile spacing
         self.left_hand = int(tile_width / 2)
-        self.left = int((width - (tile_width * COL)) / 2 + tile_width)
+        self.left = int((width - (tile_width * self.cols)) / 2 + tile_width)
         self.xinc = int(tile_width)
         self.top = 0
         self.yinc = int(tile_height)
 
-        for i in range(ROW * COL):
+        for i in range(self.rows * self.cols):
             self.blanks.append(blank_tile(sprites, scale=scale, color=color))
             self.blanks[i].move(self.grid_to_xy(i))
-            self.blanks[i].set_layer(GRID)
+        sprites.set_layers(self.blanks, GRID)
 
     def clear(self):
-        for i in range(ROW * COL):
+        for i in range(self.rows * self.cols):
             self.grid[i] = None
+        self._cells.clear()
+        self.model.clear()
+
+    def set_tile(self, i, tile):
+        ''' Put a tile (or None) in grid[i]. '''
+        if self.grid[i] is not None and \
+           self._cells.get(self.grid[i].spr) == i:
+            del self._cells[self.grid[i].spr]
+        self.grid[i] = tile
+        if tile is not None:
+            self._cells[tile.spr] = i
+        if tile is None:
+            self.model.remove(i)
+        else:
+            self.model.place(i, tile.piece)
+
+    def sync(self, i, deck):
+        ''' Show the tile (or no tile) that the model has in grid[i],
+        e.g., after an undo. '''
+        if self.grid[i] is not None and \
+           self._cells.get(self.grid[i].spr) == i:
+            del self._cells[self.grid[i].spr]
+        piece = self.model.cells[i]
+        if piece is None:
+            self.grid[i] = None
+            return
+        self.grid[i] = deck.piece_to_tile(piece)
+        self._cells[self.grid[i].spr] = i
+        self.grid[i].set_orientation(piece.orientation)
+        self.grid[i].spr.move(self.grid_to_xy(i))
+        self.grid[i].spr.set_layer(TILES)
 
     def tiles_in_grid(self):
         ''' How many tiles are on the grid? '''
-        return ROW * COL - self.grid.count(None)
+        return self.model.count()
 
-    def serialize(self):
-        ''' Serialize the grid for passing to share and saving '''
+    def serialize(self, pending=None):
+        ''' Serialize the grid for passing to share and saving (leaving
+        out the tile in grid[pending], if it has not been played yet) '''
         grid = []
-        for i in range(ROW * COL):
-            if self.grid[i] is not None:
+        for i in range(self.rows * self.cols):
+            if self.grid[i] is not None and i != pending:
                 grid.append([self.grid[i].number, self.grid[i].orientation])
             else:
                 grid.append([None, None])
-        return json_dump(grid)
+        return dump_grid(grid)
 
     def restore(self, grid_as_text, deck):
         ''' Restore tiles to grid upon resume or share. '''
         self.hide()
-        grid = json_load(grid_as_text)
-        for i in range(ROW * COL):
+        grid = load(grid_as_text)
+        for i in range(self.rows * self.cols):
             if grid[i][0] is None:
-                self.grid[i] = None
+                self.set_tile(i, None)
             else:
-                for k in range(ROW * COL):
-                    if deck.tiles[k].number == grid[i][0]:
-                        self.add_tile_to_grid(k, grid[i][1], i, deck)
-                        break
+                self.add_tile_to_grid(grid[i][0], grid[i][1], i, deck)
         self.show()
 
     def add_tile_to_grid(self, tile_number, orientation, grid_number, deck):
-        ''' Add tiles[tile_number] to grid[grid_number] at orientation '''
-        self.grid[grid_number] = deck.tiles[tile_number]
+        ''' Add tile tile_number to grid[grid_number] at orientation '''
+        self.set_tile(grid_number, deck.number_to_tile(tile_number))
         self.grid[grid_number].spr.move(self.grid_to_xy(grid_number))
         self.grid[grid_number].spr.set_layer(TILES)
-        while orientation > 0:
-            self.grid[grid_number].rotate_clockwise()
-            orientation -= 90
+        self.grid[grid_number].set_orientation(orientation)
 
     def place_a_tile(self, c, x, y):
         ''' Place a tile at position x,y and display it. '''
@@ -89,36 +124,41 @@ class Grid:
 
     def xy_to_grid(self, x, y):
         ''' Convert from sprite x,y to grid index. '''
-        if x > self.left:
-            return COL * int((y - self.top) / self.yinc) + \
-                   int((x - self.left) / self.xinc)
-        else:
-            return None
+        if x > self.left and y >= self.top:
+            row = int((y - self.top) / self.yinc)
+            col = int((x - self.left) / self.xinc)
+            if row < self.rows and col < self.cols:
+                return self.cols * row + col
+        return None
 
     def grid_to_xy(self, i):
         ''' Convert from grid index to sprite x,y. '''
-        return (int((self.left + i % COL * self.xinc)),
-                int((self.top + (i / COL) * self.yinc)))
+        return (int((self.left + i % self.cols * self.xinc)),
+                int((self.top + (i // self.cols) * self.yinc)))
 
     def grid_to_spr(self, i):
         ''' Return the sprite in grid-position i. '''
         return self.grid[i].spr
 
+    def tile_to_grid(self, tile):
+        ''' Return the cell that a tile is in (None if not on the grid). '''
+        return self._cells.get(tile.spr)
+
     def spr_to_grid(self, spr):
         ''' Return the index of a sprite in grid. '''
-        for i in range(ROW * COL):
-            if self.grid[i] is not None and self.grid[i].spr == spr:
-                return(i)
-        return None
+        return self._cells.get(spr)
 
     def hide(self):
         ''' Hide all of the tiles on the grid. '''
-        for i in range(ROW * COL):
+        for i in range(self.rows * self.cols):
             if self.grid[i] is not None:
                 self.grid[i].hide()
 
     def show(self):
         ''' Restore all tile on the grid to their x,y positions. '''
-        for i in range(ROW * COL):
-            self.place_a_tile(self.grid[i], self.grid_to_xy(i)[0],
-                              self.grid_to_xy(i)[1])
+        tiles = []
+        for i in range(self.rows * self.cols):
+            if self.grid[i] is not None:
+                self.grid[i].spr.move(self.grid_to_xy(i))
+                tiles.append(self.grid[i].spr)
+        self._sprites.set_layers(tiles, TILES)
@@ -10,22 +10,26 @@
 # Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
 
 
-from utils import json_dump, json_load
-
-ROW = 8
-COL = 8
-TILES = 3
+import engine
+from codec import dump_hand, load
+from constants import HAND_SIZE, TILES
 
 
 class Hand:
-    ''' Class for managing COL matrix of tiles '''
-
-    def __init__(self, tile_width, tile_height, remote=False):
-        # The tiles in your hand
+    ''' Class for managing a column of tiles '''
+
+    def __init__(self, tile_width, tile_height, remote=False, model=None):
+        # The tiles in your hand (the engine Hand holds the rules)
+        if model is None:
+            model = engine.Hand(HAND_SIZE)
+        self.model = model
+        self.size = model.size
         self.hand = []
+        # The slot that each tile in the hand is in, by its sprite
+        self._slots = {}
         self.remote = remote  # Does this hand belong to someone remote?
 
-        for i in range(COL):
+        for i in range(self.size):
             self.hand.append(None)
 
         # Tile spacing
@@ -38,60 +42,74 @@ class Hand:
         self.yinc = int(tile_height)
 
     def clear(self):
-        for i in range(COL):
+        for i in range(self.size):
             self.hand[i] = None
-
-    def deal(self, deck, number=COL):
-        ''' Deal an initial set of tiles to the hand '''
-        for i in range(number):
-            self.hand[i] = deck.deal_next_tile()
-            if self.hand[i] is not None:
-                self.hand[i].spr.move(self.hand_to_xy(i))
-                self.hand[i].spr.set_layer(TILES)
-        return True
+        self._slots.clear()
+        self.model.clear()
+
+    def set_tile(self, i, tile):
+        ''' Put a tile (or None) in hand[i]. '''
+        if self.hand[i] is not None and \
+           self._slots.get(self.hand[i].spr) == i:
+            del self._slots[self.hand[i].spr]
+        self.hand[i] = tile
+        if tile is not None:
+            self._slots[tile.spr] = i
+        if tile is None:
+            self.model.set_tile(i, None)
+        else:
+            self.model.set_tile(i, tile.piece)
+
+    def sync(self, deck):
+        ''' Show the tiles that the model has in the hand, e.g., after a
+        deal or an undo. '''
+        for i, piece in enumerate(self.model.slots):
+            if self.hand[i] is not None and \
+               self._slots.get(self.hand[i].spr) == i:
+                del self._slots[self.hand[i].spr]
+            if piece is None:
+                self.hand[i] = None
+                continue
+            self.hand[i] = deck.piece_to_tile(piece)
+            self._slots[self.hand[i].spr] = i
+            self.hand[i].set_orientation(piece.orientation)
+            self.hand[i].spr.move(self.hand_to_xy(i))
+            self.hand[i].spr.set_layer(TILES)
 
     def find_empty_slot(self):
         ''' Is there an empty slot in the hand? '''
-        for i in range(COL):
-            if self.hand[i] == None:
-                return i
-        return None
+        return self.model.find_empty_slot()
 
     def tiles_in_hand(self):
         ''' How many tiles are in the hand? '''
-        return COL - self.hand.count(None)
+        return self.model.tiles_in_hand()
 
     def serialize(self, buddy=None):
         ''' Serialize the hand for passing to share and saving '''
-        if buddy == None:
-            hand = []
-        else:
-            hand = [buddy]
-        for i in range(COL):
+        hand = []
+        for i in range(self.size):
             if self.hand[i] is not None:
                 hand.append(self.hand[i].number)
             else:
                 hand.append(None)
-        return json_dump(hand)
+        return dump_hand(hand, buddy=buddy)
 
     def restore(self, hand_as_text, deck, buddy=False):
         ''' Restore tiles to hand upon resume or share. '''
-        hand = json_load(hand_as_text)
+        hand = load(hand_as_text)
         if buddy:
             offset = 1  # skip the buddy
         else:
             offset = 0
-        for tile in range(COL):
+        for tile in range(self.size):
             i = tile + offset
             if hand[i] is None:
-                self.hand[i] = None
+                self.set_tile(tile, None)
             else:
-                for k in range(ROW * COL):
-                    if deck.tiles[k].number == hand[i]:
-                        self.hand[tile] = deck.tiles[k]
-                        self.hand[tile].spr.move(self.hand_to_xy(tile))
-                        self.hand[tile].spr.set_layer(TILES)
-                        break
+                self.set_tile(tile, deck.number_to_tile(hand[i]))
+                if self.hand[tile] is not None:
+                    self.hand[tile].spr.move(self.hand_to_xy(tile))
+                    self.hand[tile].spr.set_layer(TILES)
 
     def xy_to_hand(self, x, y):
         ''' Convert from sprite x,y to hand index. '''
@@ -108,9 +126,10 @@ class Hand:
         ''' Return the sprite in hand-position i. '''
         return self.hand[i].spr
 
+    def tile_to_hand(self, tile):
+        ''' Return the slot that a tile is in (None if not in the hand). '''
+        return self._slots.get(tile.spr)
+
     def spr_to_hand(self, spr):
         ''' Return the index of a sprite in hand. '''
-        for i in range(COL):
-            if self.hand[i] is not None and self.hand[i].spr == spr:
-                return(i)
-        return None
+        return self._slots.get(spr)
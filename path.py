@@ -16,14 +16,22 @@ from gi.repository import Gtk
 
 from gettext import gettext as _
 import os
+import sys
 
 from game import Game
+from constants import ROW, COL
+import rastercache
 
 
 class PathMain:
-    def __init__(self):
+    def __init__(self, rows=ROW, cols=COL):
         self.r = 0
 
+        # Keep the rasterized images between runs.
+        cache = os.environ.get('XDG_CACHE_HOME',
+                               os.path.join(os.path.expanduser('~'), '.cache'))
+        rastercache.CACHE.set_path(os.path.join(cache, 'paths', 'raster'))
+
         # create a new window
         self.win = Gtk.Window()
         self.win.maximize()
@@ -43,7 +51,7 @@ class PathMain:
         self.win.show_all()
 
         # Join the activity
-        self.vmw = Game(canvas)
+        self.vmw = Game(canvas, rows=rows, cols=cols)
         self.vmw.win = self.win
         self.vmw.activity = self
         self.vmw.level = 12
@@ -63,5 +71,11 @@ def main():
     return 0
 
 if __name__ == "__main__":
-    PathMain()
+    # Optionally, the board size: path.py [rows [cols]]
+    if len(sys.argv) > 2:
+        PathMain(int(sys.argv[1]), int(sys.argv[2]))
+    elif len(sys.argv) > 1:
+        PathMain(int(sys.argv[1]), int(sys.argv[1]))
+    else:
+        PathMain()
     main()
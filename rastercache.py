@@ -0,0 +1,153 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+'''
+
+rastercache.py turns SVG strings into cairo ARGB32 surfaces, rasterizing
+each SVG only once. The surfaces are kept in memory and, if a cache
+directory has been set, saved there as raw pixel data, so that later
+runs map them straight back in instead of rasterizing them again.
+
+Example usage:
+        # Keep the rasterized images between runs
+        rastercache.CACHE.set_path(os.path.join(data_path, 'raster'))
+
+        surface = svg_str_to_surface(generate_blank(scale, color))
+
+'''
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+import cairo
+
+from gi.repository import Gdk
+
+from utils import svg_str_to_pixbuf
+
+# Change the version whenever the file format changes.
+VERSION = 1
+
+# Each file holds the pixels (height rows of stride bytes) followed by
+# the width, height and stride.
+TRAILER = struct.Struct('<III')
+
+
+def pixbuf_to_surface(pixbuf):
+    ''' Paint a pixbuf into a new ARGB32 surface. '''
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, pixbuf.get_width(),
+                                 pixbuf.get_height())
+    context = cairo.Context(surface)
+    Gdk.cairo_set_source_pixbuf(context, pixbuf, 0, 0)
+    context.paint()
+    return surface
+
+
+def surface_to_pixbuf(surface):
+    ''' Copy a surface into a new pixbuf (e.g., for a Gtk.Image). '''
+    return Gdk.pixbuf_get_from_surface(surface, 0, 0, surface.get_width(),
+                                       surface.get_height())
+
+
+class RasterCache(object):
+    ''' A cache of rasterized SVGs, in memory and (optionally) on disk. '''
+
+    def __init__(self, path=None):
+        self._surfaces = {}
+        self.path = None
+        self.set_path(path)
+
+    def set_path(self, path):
+        ''' Set the cache directory (None to keep nothing on disk). '''
+        if path is not None and not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                path = None
+        self.path = path
+
+    def get_surface(self, svg_string):
+        ''' Return the surface for an SVG string. '''
+        if isinstance(svg_string, unicode):
+            svg_string = svg_string.encode('utf-8')
+        # Pixels are stored in native byte order.
+        key = hashlib.sha1('%d %s %s' % (VERSION, sys.byteorder,
+                                         svg_string)).hexdigest()
+        if key in self._surfaces:
+            return self._surfaces[key]
+        surface = None
+        if self.path is not None:
+            surface = self._load(key)
+        if surface is None:
+            surface = pixbuf_to_surface(svg_str_to_pixbuf(svg_string))
+            if self.path is not None:
+                self._save(key, surface)
+        self._surfaces[key] = surface
+        return surface
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + '.argb')
+
+    def _load(self, key):
+        ''' Map a cached surface (or return None). '''
+        try:
+            f = open(self._filename(key), 'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                # A private (copy on write) mapping: cairo needs to be
+                # able to write to its pixels.
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            except (mmap.error, ValueError):
+                return None
+        finally:
+            f.close()
+        if len(data) < TRAILER.size:
+            return None
+        width, height, stride = TRAILER.unpack(data[-TRAILER.size:])
+        if len(data) != height * stride + TRAILER.size:
+            return None
+        try:
+            return cairo.ImageSurface.create_for_data(
+                data, cairo.FORMAT_ARGB32, width, height, stride)
+        except cairo.Error:
+            return None
+
+    def _save(self, key, surface):
+        ''' Write a surface to the cache (quietly giving up on errors). '''
+        surface.flush()
+        filename = self._filename(key)
+        tmp = '%s.%d' % (filename, os.getpid())
+        try:
+            f = open(tmp, 'wb')
+            try:
+                f.write(surface.get_data())
+                f.write(TRAILER.pack(surface.get_width(),
+                                     surface.get_height(),
+                                     surface.get_stride()))
+            finally:
+                f.close()
+            os.rename(tmp, filename)
+        except (IOError, OSError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+# The cache used by svg_str_to_surface
+CACHE = RasterCache()
+
+
+def svg_str_to_surface(svg_string):
+    ''' Return the (shared) surface for an SVG string. '''
+    return CACHE.get_surface(svg_string)
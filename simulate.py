@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+'''
+
+simulate.py plays complete games of Paths without GTK, either robot
+solitaire or robot against robot, and writes the statistics for each
+game as JSON lines or CSV. The games are spread over a pool of
+processes.
+
+Example usage:
+        # 10000 games of solitaire on 4 processes, a quick random robot
+        ./simulate.py -n 10000 -j 4 --strategy random > games.jsonl
+
+        # Robot against robot, with a larger bonus
+        ./simulate.py -n 100 --players 2 --bonus 100 --format csv
+
+        # Solitaire on a 16x16 board (with a deck of 256 tiles)
+        ./simulate.py -n 100 --rows 16 --cols 16
+
+'''
+
+import argparse
+import csv
+import errno
+import json
+import os
+import random
+import sys
+from multiprocessing import Pool
+from time import time
+
+import engine
+from constants import ROW, COL
+
+FIELDS = ['game', 'seed', 'score', 'opponent_score', 'turns',
+          'closed_paths', 'nowhere_to_play']
+
+
+def play_game(options):
+    ''' Play one game; return its statistics. '''
+    game, seed, settings = options
+    random.seed(seed)
+    state = engine.GameState(settings['rows'], settings['cols'])
+    state.bonus = settings['bonus']
+    state.penalty = settings['penalty']
+    if settings['values'] is not None:
+        for piece in state.deck.by_number:
+            piece.value = settings['values'][piece.type]
+    robots = []
+    scores = []
+    for i in range(settings['players']):
+        state.add_hand()
+        robots.append(engine.Robot(budget=settings['budget'],
+                                   depth=settings['depth'], seed=seed + i))
+        scores.append(0)
+
+    # The same seed deals the same game, whatever the strategy.
+    state.deck.shuffle(seed)
+    for hand in state.hands:
+        hand.deal(state.deck)
+
+    turns = 0
+    closed_paths = 0
+    nowhere_to_play = False
+    player = 0
+    while True:
+        hand = state.hands[player]
+        # If I don't have any tiles left, time to redeal.
+        if hand.tiles_in_hand() == 0:
+            hand.deal(state.deck)
+            if hand.tiles_in_hand() == 0:
+                break
+        if settings['strategy'] == 'random':
+            moves = state.legal_moves(hand)
+            if len(moves) > 0:
+                move = moves[random.randrange(len(moves))]
+            else:
+                move = None
+        else:
+            move = robots[player].choose_move(state, hand,
+                                              settings['playouts'])
+        if move is None:
+            nowhere_to_play = True
+            break
+        piece, orientation, cell = move
+        score = state.score
+        piece.set_orientation(orientation)
+        state.place(piece, cell, hand)
+        closed_paths += len(state.score_paths(cell))
+        scores[player] += state.score - score
+        turns += 1
+        player = (player + 1) % settings['players']
+
+    for i, hand in enumerate(state.hands):
+        scores[i] += state.game_over_points(hand)
+
+    if settings['players'] > 1:
+        opponent_score = scores[1]
+    else:
+        opponent_score = None
+    return {'game': game, 'seed': seed, 'score': scores[0],
+            'opponent_score': opponent_score, 'turns': turns,
+            'closed_paths': closed_paths,
+            'nowhere_to_play': nowhere_to_play}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Play games of Paths between robots.')
+    parser.add_argument('-n', '--games', type=int, default=100,
+                        help='number of games to play')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of processes (default: one per CPU)')
+    parser.add_argument('--rows', type=int, default=ROW,
+                        help='rows on the board')
+    parser.add_argument('--cols', type=int, default=COL,
+                        help='columns on the board')
+    parser.add_argument('--players', type=int, choices=[1, 2], default=1,
+                        help='1 for robot solitaire, 2 for robot vs robot')
+    parser.add_argument('--strategy', choices=['search', 'random'],
+                        default='search', help='how the robots play')
+    parser.add_argument('--budget', type=float, default=0.05,
+                        help='seconds the search robot may take per move')
+    parser.add_argument('--playouts', type=int, default=None,
+                        help='most playouts the search robot runs per move')
+    parser.add_argument('--depth', type=int, default=6,
+                        help='turns in each search robot playout')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the first game (one more per game)')
+    parser.add_argument('--bonus', type=int, default=engine.state.BONUS,
+                        help='points for playing every tile')
+    parser.add_argument('--penalty', type=int, default=engine.state.PENALTY,
+                        help='penalty multiplier for tiles left in hand')
+    parser.add_argument('--values', default=None,
+                        help='comma-separated value of each tile type')
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        default='jsonl', help='output format')
+    parser.add_argument('-o', '--output', default=None,
+                        help='output file (default: standard output)')
+    args = parser.parse_args()
+
+    settings = {'rows': args.rows, 'cols': args.cols,
+                'players': args.players, 'strategy': args.strategy,
+                'budget': args.budget, 'playouts': args.playouts,
+                'depth': args.depth, 'bonus': args.bonus,
+                'penalty': args.penalty, 'values': None}
+    if args.values is not None:
+        settings['values'] = [int(v) for v in args.values.split(',')]
+        if len(settings['values']) != len(engine.TILE_TYPES):
+            parser.error('--values needs %d values' % len(engine.TILE_TYPES))
+
+    if args.output is None:
+        output = sys.stdout
+    else:
+        output = open(args.output, 'w')
+    if args.format == 'csv':
+        writer = csv.DictWriter(output, FIELDS)
+        writer.writeheader()
+
+    games = [(i, args.seed + i, settings) for i in range(args.games)]
+    pool = Pool(args.jobs)
+    start = time()
+    total = 0
+    nowhere = 0
+    try:
+        for result in pool.imap_unordered(play_game, games, chunksize=4):
+            if args.format == 'csv':
+                writer.writerow(result)
+            else:
+                output.write(json.dumps(result, sort_keys=True) + '\n')
+            total += result['score']
+            if result['nowhere_to_play']:
+                nowhere += 1
+    except IOError as e:
+        # No more results can be written: stop the games still running.
+        pool.terminate()
+        pool.join()
+        if e.errno != errno.EPIPE:
+            raise
+        # The reader went away (e.g., piped into head): stop quietly.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), output.fileno())
+        return 0
+    pool.close()
+    pool.join()
+    elapsed = time() - start
+    if output is not sys.stdout:
+        output.close()
+
+    if args.games > 0:
+        sys.stderr.write(
+            '%d games in %.2f seconds (%.1f games per second); '
+            'mean score %.2f; nowhere to play %.1f%%\n' % (
+                args.games, elapsed, args.games / max(elapsed, 1e-6),
+                float(total) / args.games, 100.0 * nowhere / args.games))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
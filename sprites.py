@@ -39,20 +39,20 @@ Example usage:
         # Create a new sprite collection associated with your widget
         self.sprite_list = Sprites(widget)
 
-        # Create a "pixbuf" (in this example, from SVG).
-        my_pixbuf = svg_str_to_pixbuf("<svg>...some svg code...</svg>")
+        # Create a cairo surface (in this example, from SVG).
+        my_surface = svg_str_to_surface("<svg>...some svg code...</svg>")
 
         # Create a sprite at position x1, y1.
-        my_sprite = sprites.Sprite(self.sprite_list, x1, y1, my_pixbuf)
+        my_sprite = sprites.Sprite(self.sprite_list, x1, y1, my_surface)
 
         # Move the sprite to a new position.
         my_sprite.move((x1+dx, y1+dy))
 
-        # Create another "pixbuf".
-        your_pixbuf = svg_str_to_pixbuf("<svg>...some svg code...</svg>")
+        # Create another cairo surface.
+        your_surface = svg_str_to_surface("<svg>...some svg code...</svg>")
 
         # Create a sprite at position x2, y2.
-        your_sprite = sprites.Sprite(self.sprite_list, x2, y2, my_pixbuf)
+        your_sprite = sprites.Sprite(self.sprite_list, x2, y2, your_surface)
 
         # Assign the sprites to layers.
         # In this example, your_sprite will be on top of my_sprite.
@@ -62,93 +62,252 @@ Example usage:
         # Now put my_sprite on top of your_sprite.
         my_sprite.set_layer(300)
 
+        # Move several sprites at once (in this order) to the top of a layer.
+        self.sprite_list.set_layers([my_sprite, your_sprite], 400)
+
         cr = self.window.cairo_create()
         # In your activity's do_expose_event, put in a call to redraw_sprites
         self.sprites.redraw_sprites(event.area, cairo_context)
 
-# method for converting SVG to a gtk pixbuf
-def svg_str_to_pixbuf(svg_string):
-    pl = GdkPixbuf.PixbufLoader.new_with_type('svg')
-    pl.write(svg_string)
-    pl.close()
-    pixbuf = pl.get_pixbuf()
-    return pixbuf
+# svg_str_to_surface (from rastercache.py) rasterizes SVG to a surface
 
 '''
 
+import sys
+from bisect import insort
+from collections import OrderedDict
+from math import ceil
+
 import cairo
 
 import gi
 gi.require_version("Gtk", "3.0")
 
 from gi.repository import Gtk
-from gi.repository import GdkPixbuf
 from gi.repository import Gdk
 from gi.repository import Pango
 from gi.repository import PangoCairo
 
-
-class Sprites:
+INDEX_CELL = 64  # Size (in pixels) of the cells of the hit-test index
+MASK_BUDGET = 2 * 1024 * 1024  # Bytes of alpha masks to keep
+
+# Where the alpha byte is in an (native-endian) ARGB32 pixel
+if sys.byteorder == 'little':
+    ALPHA_BYTE = 3
+else:
+    ALPHA_BYTE = 0
+
+
+def draw_order(spr):
+    ''' Sprites are drawn by layer, then in the order they were put on
+    the layer. '''
+    return (spr.layer, spr.stamp)
+
+
+def alpha_mask(surface):
+    ''' Return (width, height, alpha): the alpha value of each pixel of a
+    surface, a row at a time. '''
+    width = surface.get_width()
+    height = surface.get_height()
+    surface_format = surface.get_format()
+    if surface_format == cairo.FORMAT_RGB24:
+        return (width, height, bytearray([255]) * (width * height))
+    surface.flush()
+    data = bytearray(surface.get_data())
+    stride = surface.get_stride()
+    alpha = bytearray()
+    for y in range(height):
+        row = data[y * stride:(y + 1) * stride]
+        if surface_format == cairo.FORMAT_ARGB32:
+            alpha.extend(row[ALPHA_BYTE:width * 4:4])
+        else:  # FORMAT_A8
+            alpha.extend(row[:width])
+    return (width, height, alpha)
+
+
+class MaskCache(object):
+    ''' The alpha masks of the surfaces shown by sprites, one per surface
+    (however many sprites show it), for hit tests. The surfaces are not
+    drawn on once shown, so a mask never goes stale. The least recently
+    used masks are dropped to keep within budget bytes. '''
+
+    def __init__(self, budget=MASK_BUDGET):
+        self.budget = budget
+        self.size = 0  # bytes
+        self.hits = 0
+        self.misses = 0
+        # id: (surface, mask), oldest first. Each entry holds on to its
+        # surface, so the id is not reused.
+        self._masks = OrderedDict()
+
+    def get_mask(self, surface):
+        ''' Return the (width, height, alpha) mask of surface. '''
+        key = id(surface)
+        if key in self._masks:
+            self.hits += 1
+            entry = self._masks.pop(key)
+            self._masks[key] = entry
+            return entry[1]
+        self.misses += 1
+        mask = alpha_mask(surface)
+        self._masks[key] = (surface, mask)
+        self.size += len(mask[2])
+        while self.size > self.budget and len(self._masks) > 1:
+            key, entry = self._masks.popitem(last=False)
+            self.size -= len(entry[1][2])
+        return mask
+
+    def clear(self):
+        self._masks.clear()
+        self.size = 0
+
+
+class Sprites(object):
 
     ''' A class for the list of sprites and everything they share in common '''
 
     def __init__(self, widget):
         ''' Initialize an empty array of sprites '''
         self.widget = widget
-        self.list = []
+        # The sprites are kept in a bucket per layer, each in draw order.
+        self._layers = {}
+        self._layer_order = []  # The layers with buckets, bottom first
+        self._layer_of = {}  # The bucket that each sprite is in
         self.cr = None
         self.defer_draw = False
+        # A uniform grid over the sprites in the list: for each cell,
+        # the sprites whose rectangles overlap it.
+        self._index = {}
+        self._cells = {}  # The cells that each sprite overlaps
+        self._stamp = 0  # Orders the sprites within a layer
+        # The layers up to background_layer can be drawn once into a
+        # background surface, which is redrawn only where they change.
+        self.background_layer = None
+        self._background = None
+        self._background_dirty = []
+        self.mask_cache = MaskCache()
 
     def set_defer_draw(self, state):
         self.defer_draw = state
 
+    def set_background_layer(self, layer):
+        ''' Cache the layers up to (and including) layer in a background
+        surface (None for no background). '''
+        self.background_layer = layer
+        self._background = None
+
+    def invalidate(self, spr):
+        ''' The area under spr must be redrawn in the background (if spr
+        is part of it). '''
+        if self._background is None or self.background_layer is None or \
+           spr.layer > self.background_layer or spr not in self._layer_of:
+            return
+        self._background_dirty.append((spr.rect.x, spr.rect.y,
+                                       spr.rect.width, spr.rect.height))
+        if len(self._background_dirty) > 32:
+            # Too many pieces: just redraw around all of them.
+            x1 = min([area[0] for area in self._background_dirty])
+            y1 = min([area[1] for area in self._background_dirty])
+            x2 = max([area[0] + area[2] for area in self._background_dirty])
+            y2 = max([area[1] + area[3] for area in self._background_dirty])
+            self._background_dirty = [(x1, y1, x2 - x1, y2 - y1)]
+
     def set_cairo_context(self, cr):
         ''' Cairo context may be set or reset after __init__ '''
         self.cr = cr
 
+    @property
+    def list(self):
+        ''' The sprites in draw order (bottom first) '''
+        sprites = []
+        for layer in self._layer_order:
+            sprites.extend(self._layers[layer])
+        return sprites
+
     def get_sprite(self, i):
         ''' Return a sprint from the array '''
-        if i < 0 or i > len(self.list) - 1:
+        if i < 0 or i > len(self._layer_of) - 1:
             return(None)
         else:
             return(self.list[i])
 
     def length_of_list(self):
         ''' How many sprites are there? '''
-        return len(self.list)
+        return len(self._layer_of)
 
     def append_to_list(self, spr):
-        ''' Append a new sprite to the end of the list. '''
-        self.list.append(spr)
-
-    def insert_in_list(self, spr, i):
-        ''' Insert a sprite at position i. '''
-        if i < 0:
-            self.list.insert(0, spr)
-        elif i > len(self.list) - 1:
-            self.list.append(spr)
-        else:
-            self.list.insert(i, spr)
+        ''' Add a sprite on top of the others in its layer. '''
+        if spr.layer not in self._layers:
+            self._layers[spr.layer] = OrderedDict()
+            insort(self._layer_order, spr.layer)
+        self._layers[spr.layer][spr] = True
+        self._layer_of[spr] = spr.layer
+        self._add_to_index(spr)
+        self.invalidate(spr)
 
     def find_in_list(self, spr):
-        return (spr in self.list)
+        return spr in self._layer_of
 
     def remove_from_list(self, spr):
         ''' Remove a sprite from the list. '''
-        if spr in self.list:
-            self.list.remove(spr)
+        if spr in self._layer_of:
+            self.invalidate(spr)
+            del self._layers[self._layer_of.pop(spr)][spr]
+            self._remove_from_index(spr)
+
+    def set_layers(self, sprites, layer):
+        ''' Move sprites (in order) to the top of layer. '''
+        for spr in sprites:
+            self.remove_from_list(spr)
+            spr.layer = layer
+            self.append_to_list(spr)
+            spr.inval()
+
+    def update_index(self, spr):
+        ''' Call when a sprite in the list moves or changes size. '''
+        if spr in self._layer_of:
+            self._remove_from_index(spr)
+            self._add_to_index(spr, stamp=False)
+
+    def _add_to_index(self, spr, stamp=True):
+        if stamp:
+            # Sprites are inserted after the others in their layer.
+            self._stamp += 1
+            spr.stamp = self._stamp
+        # Note that hit() includes the right and bottom edges.
+        x0 = spr.rect.x // INDEX_CELL
+        x1 = (spr.rect.x + spr.rect.width) // INDEX_CELL
+        y0 = spr.rect.y // INDEX_CELL
+        y1 = (spr.rect.y + spr.rect.height) // INDEX_CELL
+        cells = []
+        for i in range(x0, x1 + 1):
+            for j in range(y0, y1 + 1):
+                if (i, j) in self._index:
+                    self._index[(i, j)].add(spr)
+                else:
+                    self._index[(i, j)] = set([spr])
+                cells.append((i, j))
+        self._cells[spr] = cells
+
+    def _remove_from_index(self, spr):
+        for cell in self._cells.pop(spr):
+            sprites = self._index[cell]
+            sprites.discard(spr)
+            if len(sprites) == 0:
+                del self._index[cell]
 
     def find_sprite(self, pos, region=False):
         ''' Search based on (x, y) position. Return the 'top/first' one. '''
-        list = self.list[:]
-        list.reverse()
-        for spr in list:
+        cell = (int(pos[0]) // INDEX_CELL, int(pos[1]) // INDEX_CELL)
+        if cell not in self._index:
+            return None
+        for spr in sorted(self._index[cell], key=draw_order, reverse=True):
             if spr.hit(pos, readpixel=not region):
                 return spr
         return None
 
     def redraw_sprites(self, area=None, cr=None):
-        ''' Redraw the sprites that intersect area. '''
+        ''' Redraw the sprites that intersect area (by default, the clip). '''
         # I think I need to do this to save Cairo some work
         self.defer_draw = False
         if cr is None:
@@ -158,13 +317,76 @@ class Sprites:
         if cr is None:
             print 'sprites.redraw_sprites: no Cairo context'
             return
-        for spr in self.list:
-            if area is None:
+        if area is None:
+            # Only the area inside the clip (i.e., what was exposed)
+            try:
+                areas = cr.copy_clip_rectangle_list()
+            except cairo.Error:  # The clip is not a list of rectangles.
+                x1, y1, x2, y2 = cr.clip_extents()
+                areas = [(x1, y1, x2 - x1, y2 - y1)]
+        else:
+            areas = [(area.x, area.y, area.width, area.height)]
+        if self.background_layer is None:
+            for spr in self.find_sprites_in(areas):
                 spr.draw(cr=cr)
+            return
+        self._draw_background(cr)
+        for spr in self.find_sprites_in(areas):
+            if spr.layer > self.background_layer:
+                spr.draw(cr=cr)
+
+    def _draw_background(self, cr):
+        ''' Bring the background up to date and paint it. '''
+        width = self.widget.get_allocated_width()
+        height = self.widget.get_allocated_height()
+        if self._background is None or \
+           self._background.get_width() != width or \
+           self._background.get_height() != height:
+            self._background = cairo.ImageSurface(cairo.FORMAT_ARGB32,
+                                                  width, height)
+            self._background_dirty = [(0, 0, width, height)]
+        if len(self._background_dirty) > 0:
+            background_cr = cairo.Context(self._background)
+            for x, y, w, h in self._background_dirty:
+                background_cr.rectangle(x, y, w, h)
+            background_cr.clip()
+            background_cr.set_operator(cairo.OPERATOR_CLEAR)
+            background_cr.paint()
+            background_cr.set_operator(cairo.OPERATOR_OVER)
+            for spr in self.find_sprites_in(self._background_dirty):
+                if spr.layer <= self.background_layer:
+                    spr.draw(cr=background_cr)
+            self._background_dirty = []
+        cr.set_source_surface(self._background, 0, 0)
+        cr.paint()
+
+    def find_sprites_in(self, areas):
+        ''' Return the sprites that overlap any of the (x, y, width,
+        height) areas, in draw order. '''
+        found = set()
+        for x, y, width, height in areas:
+            if width <= 0 or height <= 0:
+                continue
+            x0 = int(x) // INDEX_CELL
+            x1 = int(ceil(x + width)) // INDEX_CELL
+            y0 = int(y) // INDEX_CELL
+            y1 = int(ceil(y + height)) // INDEX_CELL
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._cells):
+                # Large area: it is quicker to try every sprite.
+                candidates = self._cells.keys()
             else:
-                intersection = spr.rect.intersect(area)
-                if intersection.width > 0 or intersection.height > 0:
-                    spr.draw(cr=cr)
+                candidates = set()
+                for i in range(x0, x1 + 1):
+                    for j in range(y0, y1 + 1):
+                        if (i, j) in self._index:
+                            candidates.update(self._index[(i, j)])
+            for spr in candidates:
+                if spr.rect.x < x + width and \
+                   x < spr.rect.x + spr.rect.width and \
+                   spr.rect.y < y + height and \
+                   y < spr.rect.y + spr.rect.height:
+                    found.add(spr)
+        return sorted(found, key=draw_order)
 
 
 class Sprite:
@@ -188,21 +410,23 @@ class Sprite:
         self._color = None
         self._margins = [0, 0, 0, 0]
         self.layer = 100
+        self.stamp = 0
         self.labels = []
+        self._layouts = []  # (key, layout, width, height) of each label
         self.cached_surfaces = []
         self._dx = []  # image offsets
         self._dy = []
         self.type = None
         self.set_image(image)
-        self._sprites.append_to_list(self)
 
         self.rect.x = int(x)
         self.rect.y = int(y)
         self.rect.width = image.get_height()
         self.rect.height = image.get_width()
+        self._sprites.append_to_list(self)
 
     def set_image(self, image, i=0, dx=0, dy=0):
-        ''' Add an image to the sprite. '''
+        ''' Add an image (a cairo surface) to the sprite. '''
 
         while len(self.cached_surfaces) < i + 1:
             self.cached_surfaces.append(None)
@@ -210,12 +434,8 @@ class Sprite:
             self._dy.append(0)
         self._dx[i] = dx
         self._dy[i] = dy
-        if isinstance(image, GdkPixbuf.Pixbuf) or \
-           isinstance(image, cairo.ImageSurface):
-            w = image.get_width()
-            h = image.get_height()
-        else:
-            w, h = image.get_size()
+        w = image.get_width()
+        h = image.get_height()
         if i == 0:  # Always reset width and height when base image changes.
             self.rect.width = w + dx
             self.rect.height = h + dy
@@ -224,22 +444,14 @@ class Sprite:
                 self.rect.width = w + dx
             if h + dy > self.rect.height:
                 self.rect.height = h + dy
-        if isinstance(image, cairo.ImageSurface):
-            self.cached_surfaces[i] = image
-        else:  # Convert to Cairo surface
-            surface = cairo.ImageSurface(
-                cairo.FORMAT_ARGB32, self.rect.width, self.rect.height)
-            context = cairo.Context(surface)
-            Gdk.cairo_set_source_pixbuf(context, image, 0, 0)
-            #context.set_source_pixbuf(image, 0, 0)
-            context.rectangle(0, 0, self.rect.width, self.rect.height)
-            context.fill()
-            self.cached_surfaces[i] = surface
+        self.cached_surfaces[i] = image
+        self._sprites.update_index(self)
 
     def move(self, pos):
         ''' Move to new (x, y) position '''
         self.inval()
         self.rect.x, self.rect.y = int(pos[0]), int(pos[1])
+        self._sprites.update_index(self)
         self.inval()
 
     def move_relative(self, pos):
@@ -247,6 +459,7 @@ class Sprite:
         self.inval()
         self.rect.x += int(pos[0])
         self.rect.y += int(pos[1])
+        self._sprites.update_index(self)
         self.inval()
 
     def get_xy(self):
@@ -269,17 +482,9 @@ class Sprite:
 
     def set_layer(self, layer=None):
         ''' Set the layer for a sprite '''
-        self._sprites.remove_from_list(self)
-        if layer is not None:
-            self.layer = layer
-        for i in range(self._sprites.length_of_list()):
-            spr = self._sprites.get_sprite(i)
-            if spr is not None and self.layer < spr.layer:
-                self._sprites.insert_in_list(self, i)
-                self.inval()
-                return
-        self._sprites.append_to_list(self)
-        self.inval()
+        if layer is None:
+            layer = self.layer
+        self._sprites.set_layers([self], layer)
 
     def set_label(self, new_label, i=0):
         ''' Set the label drawn on the sprite '''
@@ -351,6 +556,7 @@ class Sprite:
 
     def inval(self):
         ''' Invalidate a region for gtk '''
+        self._sprites.invalidate(self)
         self._sprites.widget.queue_draw_area(self.rect.x,
                                              self.rect.y,
                                              self.rect.width,
@@ -387,12 +593,8 @@ class Sprite:
             return False
         if y > self.rect.y + self.rect.height:
             return False
-        if readpixel:
-            r, g, b, a = self.get_pixel(pos)
-            if r == g == b == a == 0:
-                return False
-            if a == -1:
-                return False
+        if readpixel and self.get_alpha(pos) == 0:
+            return False
         return self._sprites.find_in_list(self)
 
     def draw_label(self, cr):
@@ -402,26 +604,7 @@ class Sprite:
             my_width = 0
         my_height = self.rect.height - self._margins[1] - self._margins[3]
         for i in range(len(self.labels)):
-            pl = PangoCairo.create_layout(cr)
-            pl.set_text(str(self.labels[i]), len(str(self.labels[i])))
-            self._fd.set_size(int(self._scale[i] * Pango.SCALE))
-            pl.set_font_description(self._fd)
-            w = pl.get_size()[0] / Pango.SCALE
-            if w > my_width:
-                if self._rescale[i]:
-                    self._fd.set_size(
-                            int(self._scale[i] * Pango.SCALE * my_width / w))
-                    pl.set_font_description(self._fd)
-                    w = pl.get_size()[0] / Pango.SCALE
-                else:
-                    j = len(self.labels[i]) - 1
-                    while(w > my_width and j > 0):
-                        t = "…" + self.labels[i][len(self.labels[i]) - j:]
-                        pl.set_text(t, len(t))
-                        self._fd.set_size(int(self._scale[i] * Pango.SCALE))
-                        pl.set_font_description(self._fd)
-                        w = pl.get_size()[0] / Pango.SCALE
-                        j -= 1
+            pl, w, h = self._label_layout(cr, i, my_width)
             if self._x_pos[i] is not None:
                 x = int(self.rect.x + self._x_pos[i])
             elif self._horiz_align[i] == "center":
@@ -430,7 +613,6 @@ class Sprite:
                 x = int(self.rect.x + self._margins[0])
             else: # right
                 x = int(self.rect.x + self.rect.width - w - self._margins[2])
-            h = pl.get_size()[1] / Pango.SCALE
             if self._y_pos[i] is not None:
                 y = int(self.rect.y + self._y_pos[i])
             elif self._vert_align[i] == "middle":
@@ -446,6 +628,47 @@ class Sprite:
             PangoCairo.show_layout(cr, pl)
             cr.restore()
 
+    def _label_layout(self, cr, i, my_width):
+        ''' Return (layout, width, height) of label i, fitted to my_width.
+        The layout is reused until the label or its attributes change. '''
+        key = (str(self.labels[i]), self._scale[i], self._rescale[i],
+               my_width, self._fd.to_string())
+        while len(self._layouts) < i + 1:
+            self._layouts.append(None)
+        if self._layouts[i] is not None and self._layouts[i][0] == key:
+            return self._layouts[i][1:]
+
+        text = key[0]
+        fd = self._fd.copy()
+        pl = PangoCairo.create_layout(cr)
+        pl.set_text(text, len(text))
+        fd.set_size(int(self._scale[i] * Pango.SCALE))
+        pl.set_font_description(fd)
+        w = pl.get_size()[0] / Pango.SCALE
+        if w > my_width:
+            if self._rescale[i]:
+                fd.set_size(int(self._scale[i] * Pango.SCALE * my_width / w))
+                pl.set_font_description(fd)
+                w = pl.get_size()[0] / Pango.SCALE
+            elif len(text) > 1:
+                # Find the longest end of the label that fits.
+                shortest = 1
+                longest = len(text) - 1
+                while shortest < longest:
+                    j = (shortest + longest + 1) // 2
+                    t = "…" + text[len(text) - j:]
+                    pl.set_text(t, len(t))
+                    if pl.get_size()[0] / Pango.SCALE > my_width:
+                        longest = j - 1
+                    else:
+                        shortest = j
+                t = "…" + text[len(text) - shortest:]
+                pl.set_text(t, len(t))
+                w = pl.get_size()[0] / Pango.SCALE
+        h = pl.get_size()[1] / Pango.SCALE
+        self._layouts[i] = (key, pl, w, h)
+        return pl, w, h
+
     def label_width(self):
         ''' Calculate the width of a label '''
         cr = self._sprites.cr
@@ -454,8 +677,9 @@ class Sprite:
             for i in range(len(self.labels)):
                 pl = PangoCairo.create_layout(cr)
                 pl.set_text(self.labels[i], len(self.labels[i]))
-                self._fd.set_size(int(self._scale[i] * Pango.SCALE))
-                pl.set_font_description(self._fd)
+                fd = self._fd.copy()
+                fd.set_size(int(self._scale[i] * Pango.SCALE))
+                pl.set_font_description(fd)
                 w = pl.get_size()[0] / Pango.SCALE
                 if w > max:
                     max = w
@@ -475,6 +699,20 @@ class Sprite:
         ''' Return the upper-left corner of the label safe zone '''
         return(self._margins[0], self._margins[1])
 
+    def get_alpha(self, pos, i=0):
+        ''' Return the alpha (0 is transparent) of the pixel at (x, y) '''
+        surface = self.cached_surfaces[i]
+        if surface.get_format() not in \
+           [cairo.FORMAT_ARGB32, cairo.FORMAT_RGB24, cairo.FORMAT_A8]:
+            r, g, b, a = self.get_pixel(pos, i)
+            return max(r, g, b, 0)
+        width, height, alpha = self._sprites.mask_cache.get_mask(surface)
+        x = int(pos[0] - self.rect.x)
+        y = int(pos[1] - self.rect.y)
+        if x < 0 or x > (width - 1) or y < 0 or y > (height - 1):
+            return 0
+        return alpha[y * width + x]
+
     def get_pixel(self, pos, i=0):
         ''' Return the pixel at (x, y) '''
         x = int(pos[0] - self.rect.x)
@@ -0,0 +1,91 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+''' Round trips through codec.py (python -m unittest discover) '''
+
+import json
+import unittest
+from random import Random
+
+import codec
+
+
+class CodecTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = Random(22)
+
+    def _grid(self, size):
+        grid = []
+        for i in range(size):
+            if self.random.random() < 0.5:
+                grid.append([self.random.randrange(size),
+                             90 * self.random.randrange(4)])
+            else:
+                grid.append([None, None])
+        return grid
+
+    def _hand(self, size):
+        return [self.random.randrange(size)
+                if self.random.random() < 0.7 else None
+                for i in range(8)]
+
+    def test_grid(self):
+        for size in [64, 256, 1024]:
+            grid = self._grid(size)
+            text = codec.dump_grid(grid)
+            self.assertTrue(text.startswith('P1:'))
+            self.assertEqual(codec.load(text), grid)
+
+    def test_empty_grid(self):
+        grid = [[None, None]] * 64
+        self.assertEqual(codec.load(codec.dump_grid(grid)), grid)
+
+    def test_deck(self):
+        for size in [64, 256, 1024]:
+            order = list(range(size))
+            self.random.shuffle(order)
+            self.assertEqual(codec.load(codec.dump_deck(order)), order)
+
+    def test_hand(self):
+        for size in [64, 1024]:
+            hand = self._hand(size)
+            self.assertEqual(codec.load(codec.dump_hand(hand)), hand)
+        self.assertEqual(codec.load(codec.dump_hand([None] * 8)),
+                         [None] * 8)
+
+    def test_hand_with_buddy(self):
+        hand = self._hand(64)
+        for buddy in ['walter', u'J\xf6rg \u6f22\u5b57']:
+            self.assertEqual(codec.load(codec.dump_hand(hand, buddy=buddy)),
+                             [buddy] + hand)
+
+    def test_compact(self):
+        grid = self._grid(64)
+        self.assertTrue(len(codec.dump_grid(grid)) * 5 <
+                        len(json.dumps(grid)))
+
+    def test_json_fallback(self):
+        grid = [[12, 90], [None, None], [3, 270]]
+        self.assertEqual(codec.load(json.dumps(grid)), grid)
+        self.assertEqual(codec.load(u'["walter", 1, null]'),
+                         ['walter', 1, None])
+        self.assertEqual(codec.load('3 1 2'), [3, 1, 2])
+
+    def test_unicode_text(self):
+        # Metadata comes back from the Journal as unicode.
+        text = unicode(codec.dump_deck([3, 1, 2, 0]))
+        self.assertEqual(codec.load(text), [3, 1, 2, 0])
+
+    def test_newer_version(self):
+        self.assertRaises(ValueError, codec.load, 'P9:AAAA')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+''' Undo and redo in the engine (python -m unittest discover) '''
+
+import unittest
+from random import Random
+
+import engine
+
+
+def closed_paths(board):
+    ''' The closed paths on the board, as sorted tuples of (cell, path).
+    '''
+    closed = set()
+    for cell in range(len(board.cells)):
+        for members in board.complete_paths(cell):
+            closed.add(tuple(sorted([tuple(member) for member in members])))
+    return closed
+
+
+def path_sets(board):
+    ''' Each path on the board, with the paths it is joined to and its
+    count of open ends. '''
+    tracker = board.paths
+    sets = {}
+    for cell, piece in enumerate(board.cells):
+        if piece is None:
+            continue
+        for p in range(len(piece.masks)):
+            root = tracker._find(2 * cell + p)
+            sets[(cell, p)] = (tuple(sorted([tuple(member) for member in
+                                             tracker._members[root]])),
+                               tracker._open[root])
+    return sets
+
+
+def rebuilt(board):
+    ''' A new board holding the same tiles, with its paths worked out
+    from scratch. '''
+    fresh = engine.Board(board.rows, board.cols)
+    for cell, piece in enumerate(board.cells):
+        if piece is not None:
+            fresh.place(cell, piece)
+    fresh.complete_paths(None)
+    return fresh
+
+
+class UndoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = Random(24)
+
+    def _snapshot(self, state):
+        board = state.board
+        board.complete_paths(None)
+        return ([None if piece is None else (piece.number, piece.orientation)
+                 for piece in board.cells],
+                [[None if piece is None else piece.number
+                  for piece in hand.slots] for hand in state.hands],
+                [piece.orientation for piece in state.deck.by_number],
+                state.deck.index, state.score, closed_paths(board),
+                sorted(board.frontier))
+
+    def _play_a_game(self, state, hand):
+        ''' Play (and rotate and deal) at random; return a snapshot after
+        each change. '''
+        snapshots = [self._snapshot(state)]
+        while True:
+            if hand.tiles_in_hand() == 0:
+                if state.deck.empty():
+                    break
+                state.deal(hand)
+                snapshots.append(self._snapshot(state))
+            moves = state.legal_moves(hand)
+            if len(moves) == 0:
+                break
+            piece, orientation, cell = moves[
+                self.random.randrange(len(moves))]
+            if self.random.random() < 0.3:
+                state.rotate(piece, (orientation + 90) % 360)
+                snapshots.append(self._snapshot(state))
+            state.play(piece, orientation, cell, hand)
+            snapshots.append(self._snapshot(state))
+        return snapshots
+
+    def test_undo_redo(self):
+        scored = False
+        for seed in range(4):
+            state = engine.GameState()
+            hand = state.add_hand()
+            state.deck.shuffle(seed)
+            state.deal(hand)
+            state.undo_stack = []  # (the first deal stays)
+            snapshots = self._play_a_game(state, hand)
+            scored = scored or state.score > 0
+            for snapshot in reversed(snapshots[:-1]):
+                self.assertTrue(state.undo())
+                self.assertEqual(self._snapshot(state), snapshot)
+            self.assertFalse(state.undo())
+            for snapshot in snapshots[1:]:
+                self.assertTrue(state.redo())
+                self.assertEqual(self._snapshot(state), snapshot)
+            self.assertFalse(state.redo())
+        self.assertTrue(scored)  # (so some paths were closed and undone)
+
+    def test_undo_matches_rebuild(self):
+        state = engine.GameState()
+        hand = state.add_hand()
+        state.deck.shuffle(7)
+        state.deal(hand)
+        self._play_a_game(state, hand)
+        while state.undo():
+            board = state.board
+            board.complete_paths(None)
+            self.assertEqual(path_sets(board), path_sets(rebuilt(board)))
+
+    def test_redo_is_forgotten(self):
+        state = engine.GameState()
+        hand = state.add_hand()
+        state.deck.shuffle(3)
+        state.deal(hand)
+        piece, orientation, cell = state.legal_moves(hand)[0]
+        state.play(piece, orientation, cell, hand)
+        self.assertTrue(state.undo())
+        state.rotate(piece, (orientation + 90) % 360)
+        self.assertFalse(state.redo())
+
+
+class RemoveTest(unittest.TestCase):
+
+    def _board(self, seed):
+        ''' A board with a few dozen tiles played on it. '''
+        state = engine.GameState()
+        hand = state.add_hand()
+        state.deck.shuffle(seed)
+        random = Random(seed)
+        played = []
+        for turn in range(30):
+            if hand.tiles_in_hand() == 0:
+                state.deal(hand)
+            moves = state.legal_moves(hand)
+            if len(moves) == 0:
+                break
+            piece, orientation, cell = moves[random.randrange(len(moves))]
+            state.play(piece, orientation, cell, hand)
+            played.append(cell)
+        return state, played
+
+    def test_remove_last(self):
+        state, played = self._board(1)
+        board = state.board
+        self.assertTrue(board.remove(played[-1]) is not None)
+        self.assertEqual(path_sets(board), path_sets(rebuilt(board)))
+
+    def test_remove_joined_tile(self):
+        for seed in range(4):
+            state, played = self._board(seed)
+            board = state.board
+            # A tile joined to the paths of its neighbors, but not the last
+            # one added, cannot be taken out by undoing its joins.
+            joined = [cell for cell, joins in board.paths._joins[:-1]
+                      if [join for join in joins if join[1] is not None]]
+            cell = joined[len(joined) // 2]
+            self.assertFalse(board.paths.remove(cell))
+            piece = board.remove(cell)
+            self.assertTrue(piece is not None)
+            board.complete_paths(None)
+            self.assertEqual(path_sets(board), path_sets(rebuilt(board)))
+            self.assertEqual(closed_paths(board),
+                             closed_paths(rebuilt(board)))
+            # and the board goes on from there.
+            board.place(cell, piece)
+            board.complete_paths(None)
+            self.assertEqual(path_sets(board), path_sets(rebuilt(board)))
+
+
+if __name__ == '__main__':
+    unittest.main()
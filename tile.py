@@ -10,66 +10,82 @@
 # Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
 
 
-from constants import NORTH, EAST, SOUTH, WEST, HIDE, TILES
+from constants import HIDE, TILES
 from sprites import Sprite
-from utils import svg_str_to_pixbuf
+from rastercache import svg_str_to_surface
 
 
 class Tile:
+    ''' The view of a tile: a sprite showing images from an Atlas. The
+    rules live in the engine Piece. '''
 
-    def __init__(self, sprites, svg, svgs, tile_type='tile', number=0):
-        self.highlight = [svg_str_to_pixbuf(svg)]
-        self.spr = Sprite(sprites, 0, 0, self.highlight[0])
-        for s in svgs:
-            self.highlight.append(svg_str_to_pixbuf(s))
-        self.paths = []  # [[N, E, S, W], [N, E, S, W]]
+    def __init__(self, sprites, piece, atlas):
+        self.piece = piece
+        self._atlas = atlas
+        self.spr = Sprite(sprites, 0, 0, self.get_image(0))
         self.shape = None
-        self.orientation = 0
-        self.type = tile_type
-        self.number = number
-        self.value = 1
         self.spr.set_label_color('#FF0000')
 
+    @property
+    def number(self):
+        return self.piece.number
+
+    @property
+    def type(self):
+        return self.piece.type
+
+    @property
+    def paths(self):
+        return self.piece.paths
+
+    @property
+    def orientation(self):
+        return self.piece.orientation
+
     def set_value(self, value):
-        self.value = value
+        self.piece.value = value
 
     def get_value(self):
-        return self.value
-
-    def set_paths(self, paths):
-        for c in paths:
-            self.paths.append(c)
+        return self.piece.value
 
     def get_paths(self):
-        return self.paths
+        return self.piece.paths
+
+    def get_image(self, h, turns=None):
+        ''' Return highlight image h in the current (or given) orientation.
+        '''
+        if turns is None:
+            turns = self.piece.turns
+        return self._atlas.get_image(self.piece.type, h, turns)
 
     def reset(self):
         self.spr.set_layer(HIDE)
         self.shape = None
-        self.spr.set_shape(self.highlight[0])
-        while self.orientation != 0:
-            self.rotate_clockwise()
+        self.piece.reset()
+        self.spr.set_shape(self.get_image(0))
 
     def set_shape(self, path):
         if self.shape is None:
-            self.spr.set_shape(self.highlight[path + 1])
+            self.spr.set_shape(self.get_image(path + 1))
             self.shape = path
         elif self.shape != path:
-            self.spr.set_shape(self.highlight[-1])
+            self.spr.set_shape(self.get_image(
+                self._atlas.variants(self.piece.type) - 1))
+
+    def clear_shape(self):
+        ''' Stop highlighting the closed paths of the tile. '''
+        self.shape = None
+        self.spr.set_shape(self.get_image(0))
+
+    def set_orientation(self, orientation):
+        ''' Set the orientation of the tile and its paths '''
+        self.piece.set_orientation(orientation)
+        self.spr.set_shape(self.get_image(0))
 
     def rotate_clockwise(self):
         """ rotate the tile and its paths """
-        for i in range(len(self.paths)):
-            west = self.paths[i][WEST]
-            self.paths[i][WEST] = self.paths[i][SOUTH]
-            self.paths[i][SOUTH] = self.paths[i][EAST]
-            self.paths[i][EAST] = self.paths[i][NORTH]
-            self.paths[i][NORTH] = west
-        for h in range(len(self.highlight)):
-            self.highlight[h] = self.highlight[h].rotate_simple(270)
-        self.spr.set_shape(self.highlight[0])
-        self.orientation += 90
-        self.orientation %= 360
+        self.piece.rotate_clockwise()
+        self.spr.set_shape(self.get_image(0))
 
     def show_tile(self):
         self.spr.set_layer(CARDS)
@@ -85,25 +101,28 @@ from genpieces import generate_board, generate_x, generate_blank, \
     generate_corners
 
 
-def board_card(sprites, scale=1.0):
-    return Sprite(sprites, 0, 0, svg_str_to_pixbuf(generate_board(scale)))
+def board_card(sprites, scale=1.0, rows=8, cols=8):
+    return Sprite(sprites, 0, 0, svg_str_to_surface(
+            generate_board(scale, rows=rows, cols=cols)))
 
 
 def error_graphic(sprites, scale=1.0):
-    return Sprite(sprites, -100, 0, svg_str_to_pixbuf(generate_x(0.5 * scale)))
+    return Sprite(sprites, -100, 0, svg_str_to_surface(
+            generate_x(0.5 * scale)))
 
 
 def blank_tile(sprites, scale=1.0, color='#80FF80'):
-    return Sprite(sprites, 0, 0, svg_str_to_pixbuf(
+    # The grid blanks all share one surface.
+    return Sprite(sprites, 0, 0, svg_str_to_surface(
             generate_blank(scale, color)))
 
 
 def highlight_graphic(sprites, scale=1.0):
-    return [Sprite(sprites, -100, 0, svg_str_to_pixbuf(
+    return [Sprite(sprites, -100, 0, svg_str_to_surface(
                 generate_corners(0, 0.125 * scale))),
-            Sprite(sprites, -100, 0, svg_str_to_pixbuf(
+            Sprite(sprites, -100, 0, svg_str_to_surface(
                 generate_corners(1, 0.125 * scale))),
-            Sprite(sprites, -100, 0, svg_str_to_pixbuf(
+            Sprite(sprites, -100, 0, svg_str_to_surface(
                 generate_corners(2, 0.125 * scale))),
-            Sprite(sprites, -100, 0, svg_str_to_pixbuf(
+            Sprite(sprites, -100, 0, svg_str_to_surface(
                 generate_corners(3, 0.125 * scale)))]